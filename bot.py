@@ -9,6 +9,7 @@ License: MIT
 """
 
 import logging
+import re
 import sys
 from telegram import Update
 from telegram.ext import (
@@ -19,7 +20,7 @@ from telegram.ext import (
     filters,
 )
 
-from config import TELEGRAM_BOT_TOKEN, COPYRIGHT_REMINDER
+from config import TELEGRAM_BOT_TOKEN, COPYRIGHT_REMINDER, SECURE_DELETE_MODE
 from handlers.start import start_command, help_command
 from handlers.upload import (
     handle_document,
@@ -40,7 +41,10 @@ from handlers.storage import (
     save_file_callback,
 )
 from handlers.download import handle_url_message, download_callback
-from services.cleanup import cleanup_temp_files
+from services.cleanup import cleanup_temp_files, wait_pending_deletes, probe_fast_delete
+from services.uploader import start_upload_workers, stop_upload_workers
+from services.ffmpeg import hw_encoder
+from services.downloader import shutdown_ytdlp_pool
 
 # Configure logging
 logging.basicConfig(
@@ -49,26 +53,76 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Callback query patterns, compiled once and shared by the handlers below
+RIGHTS_CONFIRM_PATTERN = re.compile(r"^rights_confirm$")
+RIGHTS_CANCEL_PATTERN = re.compile(r"^rights_cancel$")
+ACTION_CANCEL_PATTERN = re.compile(r"^action_cancel$")
+ACTION_METADATA_PATTERN = re.compile(r"^action_metadata$")
+ACTION_SAVE_PATTERN = re.compile(r"^action_save$")
+DOWNLOAD_PATTERN = re.compile(r"^dl_")
+CONVERSION_PATTERN = re.compile(
+    r"^(convert_.*|action_(?:extract_audio|video_quality|audio_quality))$"
+)
+QUALITY_PATTERN = re.compile(r"^quality_")
+
+# Startup and error output, built once at import
+REMINDER = (
+    "This bot is for processing files you OWN or have "
+    "EXPLICIT PERMISSION to use. Do not use for copyrighted "
+    "content without authorization."
+)
+
+BANNER = "\n".join([
+    "=" * 60,
+    "  TELEGRAM MEDIA BOT",
+    "=" * 60,
+    "",
+    "Starting bot...",
+    "",
+    "IMPORTANT REMINDER:",
+    "This bot is for processing files you OWN or have",
+    "EXPLICIT PERMISSION to use. Do not use for copyrighted",
+    "content without authorization.",
+    "",
+    "=" * 60,
+    "",
+])
+
+TOKEN_ERROR = "\n".join([
+    "=" * 60,
+    "ERROR: Telegram Bot Token not configured!",
+    "=" * 60,
+    "",
+    "Please follow these steps:",
+    "1. Create a bot via @BotFather on Telegram",
+    "2. Copy the bot token",
+    "3. Create a .env file with: TELEGRAM_BOT_TOKEN=your_token",
+    "",
+    "See .env.example for reference.",
+    "=" * 60,
+    "",
+])
+
+ERROR_MESSAGE = (
+    "❌ **An error occurred while processing your request.**\n\n"
+    "Please try again or send a different file.\n\n"
+    + COPYRIGHT_REMINDER
+)
+
 
 async def error_handler(update: Update, context) -> None:
     """Handle errors gracefully and remind about copyright."""
     logger.error(f"Exception while handling update: {context.error}")
     
-    error_message = (
-        "❌ **An error occurred while processing your request.**\n\n"
-        "Please try again or send a different file.\n\n"
-        f"{COPYRIGHT_REMINDER}"
-    )
-    
     try:
         if update and update.effective_message:
             await update.effective_message.reply_text(
-                error_message,
+                ERROR_MESSAGE,
                 parse_mode="Markdown"
             )
         elif update and update.callback_query:
             await update.callback_query.edit_message_text(
-                error_message,
+                ERROR_MESSAGE,
                 parse_mode="Markdown"
             )
     except Exception as e:
@@ -77,64 +131,88 @@ async def error_handler(update: Update, context) -> None:
 
 async def post_init(application: Application) -> None:
     """Perform post-initialization tasks."""
+    # Probe the temp volume before the startup cleanup deletes anything
+    fast_delete = probe_fast_delete()
+    
     # Clean up old temp files on startup
     deleted = await cleanup_temp_files(max_age_hours=1)
     if deleted > 0:
         logger.info(f"Cleaned up {deleted} old temporary file(s)")
+    
+    if SECURE_DELETE_MODE == "paranoid-hdd" and not fast_delete:
+        logger.info("Temp file deletion: overwrite before unlink (paranoid-hdd)")
+    elif fast_delete:
+        logger.info("Temp file deletion: unlink + TRIM (encrypted volume with discards)")
+    else:
+        logger.info("Temp file deletion: unlink + TRIM")
+    
+    # Detect a hardware video encoder once, before the first conversion
+    encoder = await hw_encoder()
+    logger.info(f"Video encoder: {encoder or 'libx264 (software)'}")
+    
+    # Start background workers for outgoing uploads
+    start_upload_workers(application)
+
+
+async def post_shutdown(application: Application) -> None:
+    """Perform shutdown tasks."""
+    await stop_upload_workers(application)
+    await wait_pending_deletes()
+    shutdown_ytdlp_pool()
 
 
 def main() -> None:
     """Start the bot."""
     # Validate token
     if not TELEGRAM_BOT_TOKEN or TELEGRAM_BOT_TOKEN == "your_bot_token_here":
-        print("=" * 60)
-        print("ERROR: Telegram Bot Token not configured!")
-        print("=" * 60)
-        print()
-        print("Please follow these steps:")
-        print("1. Create a bot via @BotFather on Telegram")
-        print("2. Copy the bot token")
-        print("3. Create a .env file with: TELEGRAM_BOT_TOKEN=your_token")
-        print()
-        print("See .env.example for reference.")
-        print("=" * 60)
+        sys.stdout.write(TOKEN_ERROR)
         sys.exit(1)
     
-    print("=" * 60)
-    print("  TELEGRAM MEDIA BOT")
-    print("=" * 60)
-    print()
-    print("Starting bot...")
-    print()
-    print("IMPORTANT REMINDER:")
-    print("This bot is for processing files you OWN or have")
-    print("EXPLICIT PERMISSION to use. Do not use for copyrighted")
-    print("content without authorization.")
-    print()
-    print("=" * 60)
-    
     # Import config for local API settings
     from config import USE_LOCAL_API, LOCAL_API_URL, MAX_FILE_SIZE_MB
     
-    # Create the application with local API server if configured
     if USE_LOCAL_API:
-        print(f"\n🖥️  Using LOCAL Bot API Server: {LOCAL_API_URL}")
-        print(f"📁 Max file size: {MAX_FILE_SIZE_MB} MB")
-        print()
-        application = (
-            Application.builder()
-            .token(TELEGRAM_BOT_TOKEN)
+        api_info = f"🖥️  Using LOCAL Bot API Server: {LOCAL_API_URL}"
+    else:
+        api_info = "☁️  Using Telegram Cloud API"
+    
+    # Show the banner on a terminal; under systemd/docker send it to the log instead
+    if sys.stdout.isatty():
+        sys.stdout.write(
+            f"{BANNER}\n{api_info}\n📁 Max file size: {MAX_FILE_SIZE_MB} MB\n\n"
+        )
+    else:
+        logger.info(REMINDER)
+        logger.info(f"{api_info} (max file size: {MAX_FILE_SIZE_MB} MB)")
+    
+    # Create the application. Long streaming uploads run alongside
+    # getUpdates, so the request pool gets plenty of connections and
+    # timeouts long enough for multi-GB files.
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .connection_pool_size(128)
+        .pool_timeout(60)
+        .connect_timeout(30)
+        .read_timeout(1800)
+        .write_timeout(1800)
+        .get_updates_connection_pool_size(1)
+        .get_updates_pool_timeout(60)
+        .get_updates_read_timeout(60)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    
+    # Use the local API server if configured
+    if USE_LOCAL_API:
+        builder = (
+            builder
             .base_url(LOCAL_API_URL)
             .base_file_url(LOCAL_API_URL.replace("/bot", "/file/bot"))
             .local_mode(True)
-            .post_init(post_init)
-            .build()
         )
-    else:
-        print(f"\n☁️  Using Telegram Cloud API")
-        print(f"📁 Max file size: {MAX_FILE_SIZE_MB} MB")
-        print()
-        application = Application.builder().token(TELEGRAM_BOT_TOKEN).post_init(post_init).build()
+    
+    application = builder.build()
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
@@ -154,21 +232,18 @@ def main() -> None:
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_url_message))
     
     # Add callback query handlers
-    application.add_handler(CallbackQueryHandler(rights_confirm_callback, pattern="^rights_confirm$"))
-    application.add_handler(CallbackQueryHandler(rights_cancel_callback, pattern="^rights_cancel$"))
-    application.add_handler(CallbackQueryHandler(action_cancel_callback, pattern="^action_cancel$"))
-    application.add_handler(CallbackQueryHandler(metadata_callback, pattern="^action_metadata$"))
-    application.add_handler(CallbackQueryHandler(save_file_callback, pattern="^action_save$"))
+    application.add_handler(CallbackQueryHandler(rights_confirm_callback, pattern=RIGHTS_CONFIRM_PATTERN))
+    application.add_handler(CallbackQueryHandler(rights_cancel_callback, pattern=RIGHTS_CANCEL_PATTERN))
+    application.add_handler(CallbackQueryHandler(action_cancel_callback, pattern=ACTION_CANCEL_PATTERN))
+    application.add_handler(CallbackQueryHandler(metadata_callback, pattern=ACTION_METADATA_PATTERN))
+    application.add_handler(CallbackQueryHandler(save_file_callback, pattern=ACTION_SAVE_PATTERN))
     
     # Download callbacks
-    application.add_handler(CallbackQueryHandler(download_callback, pattern="^dl_"))
+    application.add_handler(CallbackQueryHandler(download_callback, pattern=DOWNLOAD_PATTERN))
     
     # Conversion callbacks
-    application.add_handler(CallbackQueryHandler(conversion_callback, pattern="^convert_"))
-    application.add_handler(CallbackQueryHandler(conversion_callback, pattern="^action_extract_audio$"))
-    application.add_handler(CallbackQueryHandler(conversion_callback, pattern="^action_video_quality$"))
-    application.add_handler(CallbackQueryHandler(conversion_callback, pattern="^action_audio_quality$"))
-    application.add_handler(CallbackQueryHandler(quality_callback, pattern="^quality_"))
+    application.add_handler(CallbackQueryHandler(conversion_callback, pattern=CONVERSION_PATTERN))
+    application.add_handler(CallbackQueryHandler(quality_callback, pattern=QUALITY_PATTERN))
     
     # Add error handler
     application.add_error_handler(error_handler)
@@ -5,6 +5,8 @@ Loads environment variables and defines constants.
 
 import os
 from pathlib import Path
+from types import MappingProxyType
+from typing import NamedTuple
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -23,6 +25,26 @@ LOCAL_API_URL = os.getenv("LOCAL_API_URL", "http://localhost:8081/bot")
 MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "2000" if USE_LOCAL_API else "50"))
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
 
+# Background upload workers (see services/uploader.py)
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "32"))
+
+# Chunk size used when streaming files from Telegram (see services/streaming.py)
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(1024 * 1024)))
+
+# yt-dlp worker processes for info extraction and downloads (see services/downloader.py)
+YTDLP_WORKERS = int(os.getenv("YTDLP_WORKERS", "4"))
+
+# HLS/DASH fragments yt-dlp downloads in parallel for a single video
+YTDLP_FRAG_CONCURRENCY = int(os.getenv("YTDLP_FRAG_CONCURRENCY", "8"))
+
+# Maximum number of FFmpeg processes running at the same time
+FFMPEG_MAX_CONCURRENT = int(os.getenv("FFMPEG_MAX_CONCURRENT", str(min(os.cpu_count() or 1, 4))))
+
+# Hardware H.264 encoder: "auto" (detect NVENC, then VAAPI), "nvenc", "vaapi" or "none" (libx264)
+HW_ENCODER = os.getenv("HW_ENCODER", "auto").lower()
+VAAPI_DEVICE = os.getenv("VAAPI_DEVICE", "/dev/dri/renderD128")
+
 # Directory paths
 BASE_DIR = Path(__file__).parent
 TEMP_DIR = BASE_DIR / "temp"
@@ -32,23 +54,43 @@ STORAGE_DIR = BASE_DIR / "storage"
 TEMP_DIR.mkdir(exist_ok=True)
 STORAGE_DIR.mkdir(exist_ok=True)
 
+# How temp files are deleted:
+#   "fast"         - unlink, then TRIM the temp filesystem once per cleanup cycle (SSDs)
+#   "paranoid-hdd" - overwrite with random data before unlinking (magnetic disks only)
+SECURE_DELETE_MODE = os.getenv("SECURE_DELETE_MODE", "fast").lower()
+
 # Supported formats
 SUPPORTED_VIDEO_FORMATS = [".mp4", ".avi", ".mkv", ".mov", ".webm", ".flv"]
 SUPPORTED_AUDIO_FORMATS = [".mp3", ".wav", ".aac", ".flac", ".ogg", ".m4a"]
 SUPPORTED_FORMATS = SUPPORTED_VIDEO_FORMATS + SUPPORTED_AUDIO_FORMATS
 
+# Formats FFmpeg can demux from a pipe (no seeking to an index at the end
+# of the file), so they can be streamed straight from Telegram into FFmpeg
+STREAMABLE_FORMATS = [".mkv", ".webm", ".flv", ".mp3", ".wav", ".aac", ".flac", ".ogg"]
+
 # Quality presets
-AUDIO_QUALITY_PRESETS = {
-    "low": {"bitrate": "128k", "label": "128 kbps (Low)"},
-    "medium": {"bitrate": "192k", "label": "192 kbps (Medium)"},
-    "high": {"bitrate": "320k", "label": "320 kbps (High)"},
-}
-
-VIDEO_QUALITY_PRESETS = {
-    "480p": {"resolution": "854x480", "label": "480p (SD)"},
-    "720p": {"resolution": "1280x720", "label": "720p (HD)"},
-    "1080p": {"resolution": "1920x1080", "label": "1080p (Full HD)"},
-}
+class AudioPreset(NamedTuple):
+    bitrate: str
+    label: str
+
+
+class VideoPreset(NamedTuple):
+    resolution: str
+    label: str
+
+
+# Read-only so handlers can't mutate the shared presets
+AUDIO_QUALITY_PRESETS = MappingProxyType({
+    "low": AudioPreset(bitrate="128k", label="128 kbps (Low)"),
+    "medium": AudioPreset(bitrate="192k", label="192 kbps (Medium)"),
+    "high": AudioPreset(bitrate="320k", label="320 kbps (High)"),
+})
+
+VIDEO_QUALITY_PRESETS = MappingProxyType({
+    "480p": VideoPreset(resolution="854x480", label="480p (SD)"),
+    "720p": VideoPreset(resolution="1280x720", label="720p (HD)"),
+    "1080p": VideoPreset(resolution="1920x1080", label="1080p (Full HD)"),
+})
 
 # Cookie settings for yt-dlp (to bypass rate limits)
 # Set the browser to extract cookies from, or provide a cookies file path
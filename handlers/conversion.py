@@ -3,15 +3,27 @@ Format conversion handlers for the Telegram bot.
 Handles MP3/MP4 conversion and quality adjustments.
 """
 
-from pathlib import Path
+import functools
+import aiofiles.os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from config import AUDIO_QUALITY_PRESETS, VIDEO_QUALITY_PRESETS
-from services.converter import convert_to_audio, convert_video_quality, convert_video_to_mp4
-from services.extractor import extract_audio
-from services.cleanup import generate_temp_filename, secure_delete
-from utils.validators import get_file_extension
+from config import AUDIO_QUALITY_PRESETS, VIDEO_QUALITY_PRESETS, STREAMABLE_FORMATS
+from services.converter import extract_and_transcode, convert_video_quality
+from services.extractor import extract_audio_from_stream
+from services.cleanup import generate_temp_filename, schedule_secure_delete
+from services.ratelimit import rl_edit
+from services.streaming import iter_file_chunks, local_file_path
+from services.uploader import UploadJob, enqueue_upload
+from handlers.upload import take_prefetched_file
+
+# Status messages shared by the conversion handlers
+MSG_SESSION_EXPIRED = "❌ Session expired. Please upload the file again."
+MSG_PROCESSING_AUDIO = "⏳ **Processing audio...**\nThis may take a moment."
+MSG_PROCESSING_VIDEO = "⏳ **Processing video...**\nThis may take a while."
+MSG_UPLOADING = "📤 **Uploading...**"
+MSG_AUDIO_DONE = "✅ **Audio conversion complete!**\n\nSend another file when ready."
+MSG_VIDEO_DONE = "✅ **Video conversion complete!**\n\nSend another file when ready."
 
 
 async def conversion_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -19,18 +31,9 @@ async def conversion_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     await query.answer()
     
-    data = query.data
-    
-    if data == "convert_to_mp3":
-        await show_audio_quality_options(query, context, "mp3")
-    elif data == "convert_to_mp4":
-        await convert_audio_to_mp4(query, context)
-    elif data == "action_extract_audio":
-        await show_audio_quality_options(query, context, "extract")
-    elif data == "action_video_quality":
-        await show_video_quality_options(query, context)
-    elif data == "action_audio_quality":
-        await show_audio_quality_options(query, context, "convert")
+    action = CONVERSION_ACTIONS.get(query.data)
+    if action:
+        await action(query, context)
 
 
 async def show_audio_quality_options(query, context: ContextTypes.DEFAULT_TYPE, mode: str) -> None:
@@ -41,7 +44,7 @@ async def show_audio_quality_options(query, context: ContextTypes.DEFAULT_TYPE,
     for key, preset in AUDIO_QUALITY_PRESETS.items():
         buttons.append([
             InlineKeyboardButton(
-                f"🎵 {preset['label']}", 
+                f"🎵 {preset.label}", 
                 callback_data=f"quality_audio_{key}"
             )
         ])
@@ -49,7 +52,8 @@ async def show_audio_quality_options(query, context: ContextTypes.DEFAULT_TYPE,
     
     reply_markup = InlineKeyboardMarkup(buttons)
     
-    await query.edit_message_text(
+    await rl_edit(
+        query,
         "🎚️ **Select Audio Quality:**\n\n"
         "Higher quality = larger file size",
         parse_mode="Markdown",
@@ -63,7 +67,7 @@ async def show_video_quality_options(query, context: ContextTypes.DEFAULT_TYPE)
     for key, preset in VIDEO_QUALITY_PRESETS.items():
         buttons.append([
             InlineKeyboardButton(
-                f"📐 {preset['label']}", 
+                f"📐 {preset.label}", 
                 callback_data=f"quality_video_{key}"
             )
         ])
@@ -71,7 +75,8 @@ async def show_video_quality_options(query, context: ContextTypes.DEFAULT_TYPE)
     
     reply_markup = InlineKeyboardMarkup(buttons)
     
-    await query.edit_message_text(
+    await rl_edit(
+        query,
         "📐 **Select Video Quality:**\n\n"
         "Higher resolution = larger file size",
         parse_mode="Markdown",
@@ -89,93 +94,121 @@ async def quality_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     pending_file = context.user_data.get('pending_file')
     
     if not pending_file:
-        await query.edit_message_text("❌ Session expired. Please upload the file again.")
+        await rl_edit(query, MSG_SESSION_EXPIRED)
         return
     
-    if data.startswith("quality_audio_"):
-        quality = data.replace("quality_audio_", "")
+    # Callback data looks like "quality_<audio|video>_<preset>"
+    kind, _, quality = data[len("quality_"):].partition("_")
+    
+    if kind == "audio":
         await process_audio_conversion(query, context, user_id, pending_file, quality)
-    elif data.startswith("quality_video_"):
-        quality = data.replace("quality_video_", "")
+    elif kind == "video":
         await process_video_conversion(query, context, user_id, pending_file, quality)
 
 
 async def process_audio_conversion(query, context, user_id: int, pending_file: dict, quality: str) -> None:
     """Process audio extraction/conversion with selected quality."""
-    await query.edit_message_text("⏳ **Processing audio...**\nThis may take a moment.", parse_mode="Markdown")
+    await rl_edit(query, MSG_PROCESSING_AUDIO, parse_mode="Markdown")
     
     temp_input = None
     temp_output = None
     
     try:
-        # Download the file
-        file = await context.bot.get_file(pending_file['file_id'])
-        temp_input = generate_temp_filename(user_id, pending_file['filename'])
-        await file.download_to_drive(str(temp_input))
-        
         # Convert/extract to MP3
-        output_name = Path(pending_file['filename']).stem + ".mp3"
+        output_name = pending_file['stem'] + ".mp3"
         temp_output = generate_temp_filename(user_id, output_name, f"_{quality}")
         
-        bitrate = AUDIO_QUALITY_PRESETS.get(quality, AUDIO_QUALITY_PRESETS['medium'])['bitrate']
-        await extract_audio(temp_input, temp_output, bitrate)
+        preset = AUDIO_QUALITY_PRESETS.get(quality) or AUDIO_QUALITY_PRESETS['medium']
+        bitrate = preset.bitrate
         
-        # Send the converted file
-        await query.edit_message_text("📤 **Uploading...**", parse_mode="Markdown")
+        # Prefer the copy prefetched during rights confirmation. Otherwise the
+        # local Bot API server may already have the file on disk; read it in
+        # place, and since it belongs to the server never add it to our cleanup.
+        temp_input = await take_prefetched_file(context)
+        source = temp_input
+        if not source:
+            file = await context.bot.get_file(pending_file['file_id'])
+            source = local_file_path(file)
         
-        with open(temp_output, 'rb') as audio_file:
-            await context.bot.send_audio(
-                chat_id=query.message.chat_id,
-                audio=audio_file,
-                filename=output_name,
-                caption=f"🎵 Converted to MP3 ({AUDIO_QUALITY_PRESETS[quality]['label']})"
-            )
+        if source:
+            await extract_and_transcode(source, temp_output, "mp3", bitrate)
+        elif pending_file['ext'] in STREAMABLE_FORMATS:
+            # Pipe the download straight into FFmpeg, skipping the temp input copy
+            await extract_audio_from_stream(iter_file_chunks(file), temp_output, bitrate)
+        else:
+            # Containers like MP4 need seeking, so download the file first
+            temp_input = generate_temp_filename(user_id, pending_file['filename'])
+            await file.download_to_drive(str(temp_input))
+            await extract_and_transcode(temp_input, temp_output, "mp3", bitrate)
         
-        await query.edit_message_text(
-            "✅ **Audio conversion complete!**\n\n"
-            "Send another file when ready.",
-            parse_mode="Markdown"
-        )
+        # Send the converted file
+        await rl_edit(query, MSG_UPLOADING, parse_mode="Markdown")
+        
+        # Hand the upload to the background workers; they report completion
+        # and delete the output file. The path is passed as-is so PTB streams it.
+        await enqueue_upload(context.application, UploadJob(
+            chat_id=query.message.chat_id,
+            message_id=query.message.message_id,
+            kind="audio",
+            path=temp_output,
+            send_kwargs={
+                'filename': output_name,
+                'caption': f"🎵 Converted to MP3 ({preset.label})",
+            },
+            done_text=MSG_AUDIO_DONE,
+            done_parse_mode="Markdown",
+            cleanup=(temp_output,),
+        ))
+        temp_output = None
         
     except Exception as e:
-        await query.edit_message_text(
+        await rl_edit(
+            query,
             f"❌ **Conversion failed:**\n`{str(e)}`\n\n"
             "Please try again or send a different file.",
             parse_mode="Markdown"
         )
     finally:
-        # Clean up temp files
+        # Clean up temp files in the background
         if temp_input:
-            await secure_delete(temp_input)
+            schedule_secure_delete(temp_input)
         if temp_output:
-            await secure_delete(temp_output)
+            schedule_secure_delete(temp_output)
         context.user_data.pop('pending_file', None)
         context.user_data.pop('conversion_mode', None)
 
 
 async def process_video_conversion(query, context, user_id: int, pending_file: dict, quality: str) -> None:
     """Process video quality conversion with selected quality."""
-    await query.edit_message_text("⏳ **Processing video...**\nThis may take a while.", parse_mode="Markdown")
+    await rl_edit(query, MSG_PROCESSING_VIDEO, parse_mode="Markdown")
     
     temp_input = None
     temp_output = None
     
     try:
-        # Download the file
-        file = await context.bot.get_file(pending_file['file_id'])
-        temp_input = generate_temp_filename(user_id, pending_file['filename'])
-        await file.download_to_drive(str(temp_input))
+        # Use the prefetched copy, the local Bot API server's copy in place,
+        # or download the file
+        temp_input = await take_prefetched_file(context)
+        source = temp_input
+        if not source:
+            file = await context.bot.get_file(pending_file['file_id'])
+            source = local_file_path(file)
+        if not source:
+            temp_input = generate_temp_filename(user_id, pending_file['filename'])
+            await file.download_to_drive(str(temp_input))
+            source = temp_input
         
         # Convert video
-        output_name = Path(pending_file['filename']).stem + f"_{quality}.mp4"
+        output_name = pending_file['stem'] + f"_{quality}.mp4"
         temp_output = generate_temp_filename(user_id, output_name)
         
-        await convert_video_quality(temp_input, temp_output, quality)
+        await convert_video_quality(source, temp_output, quality)
         
         # Check file size (Telegram limit is 50MB for bots)
-        file_size = temp_output.stat().st_size
+        file_size = (await aiofiles.os.stat(temp_output)).st_size
         if file_size > 50 * 1024 * 1024:
-            await query.edit_message_text(
+            await rl_edit(
+                query,
                 f"❌ **Output file too large!**\n\n"
                 f"Size: {file_size / (1024*1024):.1f} MB\n"
                 f"Telegram limit: 50 MB\n\n"
@@ -185,43 +218,58 @@ async def process_video_conversion(query, context, user_id: int, pending_file: d
             return
         
         # Send the converted file
-        await query.edit_message_text("📤 **Uploading...**", parse_mode="Markdown")
-        
-        with open(temp_output, 'rb') as video_file:
-            await context.bot.send_video(
-                chat_id=query.message.chat_id,
-                video=video_file,
-                filename=output_name,
-                caption=f"🎬 Converted to {VIDEO_QUALITY_PRESETS[quality]['label']}"
-            )
+        await rl_edit(query, MSG_UPLOADING, parse_mode="Markdown")
         
-        await query.edit_message_text(
-            "✅ **Video conversion complete!**\n\n"
-            "Send another file when ready.",
-            parse_mode="Markdown"
-        )
+        # Hand the upload to the background workers; they report completion
+        # and delete the output file. The path is passed as-is so PTB streams it.
+        await enqueue_upload(context.application, UploadJob(
+            chat_id=query.message.chat_id,
+            message_id=query.message.message_id,
+            kind="video",
+            path=temp_output,
+            send_kwargs={
+                'filename': output_name,
+                'caption': f"🎬 Converted to {VIDEO_QUALITY_PRESETS[quality].label}",
+            },
+            done_text=MSG_VIDEO_DONE,
+            done_parse_mode="Markdown",
+            cleanup=(temp_output,),
+        ))
+        temp_output = None
         
     except Exception as e:
-        await query.edit_message_text(
+        await rl_edit(
+            query,
             f"❌ **Conversion failed:**\n`{str(e)}`\n\n"
             "Please try again or send a different file.",
             parse_mode="Markdown"
         )
     finally:
-        # Clean up temp files
+        # Clean up temp files in the background
         if temp_input:
-            await secure_delete(temp_input)
+            schedule_secure_delete(temp_input)
         if temp_output:
-            await secure_delete(temp_output)
+            schedule_secure_delete(temp_output)
         context.user_data.pop('pending_file', None)
 
 
 async def convert_audio_to_mp4(query, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Convert audio file to MP4 with a static image or waveform."""
-    await query.edit_message_text(
+    await rl_edit(
+        query,
         "⚠️ **Audio to MP4 Conversion**\n\n"
         "This feature creates a video with a static background from your audio.\n"
         "Currently under development.\n\n"
         "Please try another option.",
         parse_mode="Markdown"
     )
+
+
+# Callback data handled by conversion_callback, mapped to its action
+CONVERSION_ACTIONS = {
+    "convert_to_mp3": functools.partial(show_audio_quality_options, mode="mp3"),
+    "convert_to_mp4": convert_audio_to_mp4,
+    "action_extract_audio": functools.partial(show_audio_quality_options, mode="extract"),
+    "action_video_quality": show_video_quality_options,
+    "action_audio_quality": functools.partial(show_audio_quality_options, mode="convert"),
+}
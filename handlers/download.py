@@ -4,54 +4,86 @@ Handles URL-based video downloads from YouTube, Instagram, TikTok, etc.
 """
 
 import re
+import functools
+import aiofiles.os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from telegram.helpers import escape_markdown
 
 from config import COPYRIGHT_REMINDER, MAX_FILE_SIZE_MB
 from services.downloader import (
-    get_video_info,
+    fetch_video_info,
+    evict_video_info,
     download_video,
     is_supported_url,
-    format_duration,
     format_views,
     get_platform_emoji,
 )
-from services.cleanup import secure_delete
+from utils.formatters import format_duration
+from services.cleanup import schedule_secure_delete
+from services.ratelimit import rl_edit
+from services.uploader import UploadJob, enqueue_upload
 
+# Fixed status messages shared by the download handlers
+MSG_FETCHING = "⏳ **Fetching video info...**"
+MSG_VIDEO_UNAVAILABLE = (
+    "❌ Video unavailable\n\n"
+    "This video might be private, deleted, or region-locked."
+)
+MSG_LOGIN_REQUIRED = (
+    "❌ Login required\n\n"
+    "This content requires authentication and cannot be downloaded."
+)
+MSG_CANCELLED = "✅ Download cancelled."
+MSG_SESSION_EXPIRED = "❌ Session expired. Please send the URL again."
+
+
+# Characters that must be escaped in Telegram MarkdownV2 (same set as
+# telegram.helpers.escape_markdown(version=2)), compiled once at import
+_MDV2_RE = re.compile(r'([_*\[\]()~`>#+\-=|{}.!\\])')
 
+
+@functools.lru_cache(maxsize=512)
 def safe_text(text: str) -> str:
     """Escape text for Telegram MarkdownV2 format."""
     if not text:
         return "Unknown"
     # Escape special markdown characters
-    return escape_markdown(str(text), version=2)
+    return _MDV2_RE.sub(r'\\\1', str(text))
 
 
-# URL regex pattern
+# URL regex pattern. Path segments are bounded to non-whitespace so a
+# non-matching message can't make the engine backtrack across the whole text.
+# Each site is a named group, so match.lastgroup gives the platform.
 URL_PATTERN = re.compile(
     r'https?://(?:www\.)?'
-    r'(?:youtube\.com/(?:watch\?v=|shorts/)|youtu\.be/|'
-    r'instagram\.com/(?:p/|reel/|reels/)|'
-    r'tiktok\.com/@[\w.-]+/video/|vm\.tiktok\.com/|'
-    r'twitter\.com/.+/status/|x\.com/.+/status/|'
-    r'facebook\.com/.+/videos/|fb\.watch/|'
-    r'vimeo\.com/|'
-    r'reddit\.com/r/.+/comments/)'
+    r'(?:(?P<youtube>youtube\.com/(?:watch\?v=|shorts/)|youtu\.be/)|'
+    r'(?P<instagram>instagram\.com/(?:p/|reel/|reels/))|'
+    r'(?P<tiktok>tiktok\.com/@[\w.-]+/video/|vm\.tiktok\.com/)|'
+    r'(?P<twitter>(?:twitter|x)\.com/(?:[^\s/]+/)+status/)|'
+    r'(?P<facebook>facebook\.com/\S+?/videos/|fb\.watch/)|'
+    r'(?P<vimeo>vimeo\.com/)|'
+    r'(?P<reddit>reddit\.com/r/[^\s/]+/comments/))'
     r'[\w\-._~:/?#\[\]@!$&\'()*+,;=%]+'
 )
 
+# Never scan further than Telegram's maximum message length
+MAX_SCAN_LENGTH = 4096
+
+# Hints that a message was meant to be a link, checked in a single
+# case-insensitive pass when URL_PATTERN finds nothing
+URL_HINT_PATTERN = re.compile(r'http|youtube|instagram|tiktok', re.IGNORECASE)
+
 
 async def handle_url_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle text messages containing URLs."""
     text = update.message.text
     
-    # Find URLs in the message
-    urls = URL_PATTERN.findall(text)
+    # Find the first URL in the message (search stops at the first match)
+    match = URL_PATTERN.search(text, 0, MAX_SCAN_LENGTH)
     
-    if not urls:
+    if not match:
         # Check if it looks like a URL but didn't match
-        if 'http' in text.lower() or any(domain in text.lower() for domain in ['youtube', 'instagram', 'tiktok']):
+        if URL_HINT_PATTERN.search(text, 0, MAX_SCAN_LENGTH):
             await update.message.reply_text(
                 "🔗 I detected a possible URL, but couldn't parse it.\n\n"
                 "Please send a valid link from:\n"
@@ -65,20 +97,22 @@ async def handle_url_message(update: Update, context: ContextTypes.DEFAULT_TYPE)
             )
         return
     
-    url = urls[0]  # Process first URL
+    url = match.group(0)
+    platform = match.lastgroup
     
     # Store URL in context
     context.user_data['pending_url'] = url
+    context.user_data['pending_platform'] = platform
     
     # Show processing message
     processing_msg = await update.message.reply_text(
-        "⏳ **Fetching video info...**",
+        MSG_FETCHING,
         parse_mode="Markdown"
     )
     
     try:
         # Get video info
-        info = await get_video_info(url)
+        info = await fetch_video_info(url, platform=platform)
         
         platform_emoji = get_platform_emoji(info['platform'])
         duration = format_duration(info['duration'])
@@ -147,15 +181,9 @@ async def handle_url_message(update: Update, context: ContextTypes.DEFAULT_TYPE)
     except Exception as e:
         error_msg = str(e)
         if "Video unavailable" in error_msg or "Private video" in error_msg:
-            await processing_msg.edit_text(
-                "❌ Video unavailable\n\n"
-                "This video might be private, deleted, or region-locked."
-            )
+            await processing_msg.edit_text(MSG_VIDEO_UNAVAILABLE)
         elif "Sign in" in error_msg:
-            await processing_msg.edit_text(
-                "❌ Login required\n\n"
-                "This content requires authentication and cannot be downloaded."
-            )
+            await processing_msg.edit_text(MSG_LOGIN_REQUIRED)
         else:
             # Don't use parse_mode to avoid issues with special characters in error
             await processing_msg.edit_text(
@@ -175,15 +203,16 @@ async def download_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     if data == "dl_cancel":
         context.user_data.pop('pending_url', None)
+        context.user_data.pop('pending_platform', None)
         context.user_data.pop('video_info', None)
-        await query.edit_message_text("✅ Download cancelled.")
+        await rl_edit(query, MSG_CANCELLED)
         return
     
     url = context.user_data.get('pending_url')
     video_info = context.user_data.get('video_info')
     
     if not url:
-        await query.edit_message_text("❌ Session expired. Please send the URL again.")
+        await rl_edit(query, MSG_SESSION_EXPIRED)
         return
     
     # Parse format and quality from callback data
@@ -193,11 +222,12 @@ async def download_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         format_label = "MP3 Audio"
     else:
         format_type = "video"
-        quality = data.replace("dl_video_", "")
+        quality = data.partition("dl_video_")[2]
         format_label = f"Video ({quality})"
     
     # Show downloading progress
-    await query.edit_message_text(
+    await rl_edit(
+        query,
         f"⬇️ Downloading {format_label}...\n\n"
         f"📝 {video_info['title'][:50]}...\n\n"
         "This may take a moment..."
@@ -206,62 +236,73 @@ async def download_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     filepath = None
     try:
         # Download the video
-        filepath, info = await download_video(url, user_id, format_type, quality)
+        filepath, info = await download_video(
+            url, user_id, format_type, quality,
+            platform=context.user_data.get('pending_platform')
+        )
         
         # Check file size
-        file_size = filepath.stat().st_size
+        file_size = (await aiofiles.os.stat(filepath)).st_size
         if file_size > MAX_FILE_SIZE_MB * 1024 * 1024:
-            await query.edit_message_text(
+            await rl_edit(
+                query,
                 f"❌ File too large!\n\n"
                 f"Size: {file_size / (1024*1024):.1f} MB\n"
                 f"Telegram limit: {MAX_FILE_SIZE_MB} MB\n\n"
                 "Try a lower quality or audio-only."
             )
-            if filepath:
-                await secure_delete(filepath)
             return
         
         # Upload to Telegram
-        await query.edit_message_text(f"📤 Uploading {format_label}...")
+        await rl_edit(query, f"📤 Uploading {format_label}...")
         
-        with open(filepath, 'rb') as f:
-            if format_type == "audio":
-                await context.bot.send_audio(
-                    chat_id=query.message.chat_id,
-                    audio=f,
-                    filename=filepath.name,
-                    title=info.get('title', 'Audio')[:64],
-                    caption=f"🎵 {info.get('title', 'Audio')[:100]}",
-                    read_timeout=1800,  # 30 minutes for large files
-                    write_timeout=1800,
-                    connect_timeout=60,
-                )
-            else:
-                await context.bot.send_video(
-                    chat_id=query.message.chat_id,
-                    video=f,
-                    filename=filepath.name,
-                    caption=f"🎬 {info.get('title', 'Video')[:100]}",
-                    read_timeout=1800,  # 30 minutes for large files
-                    write_timeout=1800,
-                    connect_timeout=60,
-                )
-        
-        await query.edit_message_text(
-            f"✅ Download complete!\n\n"
-            f"📝 {info.get('title', 'Media')[:100]}\n\n"
-            "Send another URL to download more!"
+        # Hand the upload to the background workers; they report completion
+        # and delete the file. The path is passed as-is so PTB streams it (or
+        # hands it to the local Bot API server) instead of reading it here.
+        if format_type == "audio":
+            send_kwargs = {
+                'filename': filepath.name,
+                'title': info.get('title', 'Audio')[:64],
+                'caption': f"🎵 {info.get('title', 'Audio')[:100]}",
+            }
+        else:
+            send_kwargs = {
+                'filename': filepath.name,
+                'caption': f"🎬 {info.get('title', 'Video')[:100]}",
+            }
+        send_kwargs.update(
+            read_timeout=1800,  # 30 minutes for large files
+            write_timeout=1800,
+            connect_timeout=60,
         )
         
+        await enqueue_upload(context.application, UploadJob(
+            chat_id=query.message.chat_id,
+            message_id=query.message.message_id,
+            kind=format_type,
+            path=filepath,
+            send_kwargs=send_kwargs,
+            done_text=f"✅ Download complete!\n\n"
+                      f"📝 {info.get('title', 'Media')[:100]}\n\n"
+                      "Send another URL to download more!",
+            cleanup=(filepath,),
+        ))
+        filepath = None
+        
     except Exception as e:
-        await query.edit_message_text(
+        # The cached info may be stale (expired formats, changed cookies),
+        # so the next attempt for this URL fetches it again
+        evict_video_info(url)
+        await rl_edit(
+            query,
             f"❌ Download failed\n\n"
             f"Error: {str(e)[:200]}\n\n"
             "Please try again or use a different quality."
         )
     finally:
-        # Clean up
-        if filepath and filepath.exists():
-            await secure_delete(filepath)
+        # Clean up in the background
+        if filepath:
+            schedule_secure_delete(filepath)
         context.user_data.pop('pending_url', None)
+        context.user_data.pop('pending_platform', None)
         context.user_data.pop('video_info', None)
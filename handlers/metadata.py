@@ -8,6 +8,8 @@ from telegram.ext import ContextTypes
 
 from services.extractor import extract_metadata, format_metadata_message
 from services.cleanup import generate_temp_filename, secure_delete
+from services.streaming import local_file_path, stream_to_disk
+from handlers.upload import take_prefetched_file
 
 
 async def metadata_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -25,23 +27,29 @@ async def metadata_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Show processing message
     await query.edit_message_text("⏳ **Extracting metadata...**", parse_mode="Markdown")
     
+    temp_path = None
     try:
         # Download the file
         file_id = pending_file['file_id']
         filename = pending_file['filename']
         
-        file = await context.bot.get_file(file_id)
-        temp_path = generate_temp_filename(user_id, filename)
-        
-        await file.download_to_drive(str(temp_path))
+        # Use the copy prefetched during rights confirmation if there is
+        # one. Otherwise probe the local Bot API server's copy in place (it
+        # belongs to the server, so it is never deleted here) or download it.
+        temp_path = await take_prefetched_file(context)
+        source = temp_path
+        if not source:
+            file = await context.bot.get_file(file_id)
+            source = local_file_path(file)
+        if not source:
+            temp_path = generate_temp_filename(user_id, filename)
+            await stream_to_disk(file, temp_path)
+            source = temp_path
         
         # Extract metadata
-        metadata = await extract_metadata(temp_path)
+        metadata = await extract_metadata(source)
         message = format_metadata_message(metadata)
         
-        # Clean up temp file
-        await secure_delete(temp_path)
-        
         # Clear pending file
         context.user_data.pop('pending_file', None)
         
@@ -59,3 +67,7 @@ async def metadata_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
             "Please try again or send a different file.",
             parse_mode="Markdown"
         )
+    finally:
+        # Clean up temp file
+        if temp_path:
+            await secure_delete(temp_path)
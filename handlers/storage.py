@@ -3,13 +3,21 @@ File storage management handlers for the Telegram bot.
 Allows users to store, list, and delete their files.
 """
 
+import asyncio
+import contextlib
+import functools
 import os
+import secrets
+import shutil
 from pathlib import Path
 from telegram import Update
 from telegram.ext import ContextTypes
 
 from config import STORAGE_DIR
 from services.cleanup import secure_delete
+from services.streaming import stream_to_disk
+from utils.formatters import format_size
+from handlers.upload import discard_prefetch, take_prefetched_file
 
 
 def get_user_storage_dir(user_id: int) -> Path:
@@ -19,14 +27,41 @@ def get_user_storage_dir(user_id: int) -> Path:
     return user_dir
 
 
-def format_file_size(size_bytes: int) -> str:
-    """Format file size in human-readable format."""
-    if size_bytes < 1024:
-        return f"{size_bytes} B"
-    elif size_bytes < 1024 * 1024:
-        return f"{size_bytes / 1024:.1f} KB"
-    else:
-        return f"{size_bytes / (1024 * 1024):.1f} MB"
+@functools.lru_cache(maxsize=10_000)
+def _resolved_user_dir(user_id: int) -> Path:
+    """Resolved path of a user's storage directory, cached since it never changes."""
+    return (STORAGE_DIR / str(user_id)).resolve()
+
+
+def reserve_save_path(user_dir: Path, filename: str) -> Path:
+    """
+    Atomically create an empty file to save an upload into.
+    
+    Uses the original filename if it is free, otherwise adds a random suffix.
+    O_EXCL makes concurrent saves of the same name pick different paths.
+    
+    Args:
+        user_dir: User's storage directory
+        filename: Original file name
+        
+    Returns:
+        Path of the newly created file
+    """
+    save_path = user_dir / filename
+    while True:
+        try:
+            os.close(os.open(save_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+            return save_path
+        except FileExistsError:
+            stem, dot, suffix = filename.rpartition('.')
+            if dot:
+                save_path = user_dir / f"{stem}_{secrets.token_hex(4)}.{suffix}"
+            else:
+                save_path = user_dir / f"{filename}_{secrets.token_hex(4)}"
+
+
+# Storage listings top out at MB
+STORAGE_SIZE_UNITS = ("B", "KB", "MB")
 
 
 async def files_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -37,7 +72,14 @@ async def files_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     user_id = update.effective_user.id
     user_dir = get_user_storage_dir(user_id)
     
-    files = list(user_dir.iterdir())
+    # One directory read; is_file() comes from the entry's type, so only
+    # the size needs a stat call
+    with os.scandir(user_dir) as it:
+        files = [
+            (entry.name, entry.stat().st_size)
+            for entry in it
+            if entry.is_file(follow_symlinks=False)
+        ]
     
     if not files:
         await update.message.reply_text(
@@ -49,20 +91,17 @@ async def files_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
     
     # Build file list
-    file_list = []
-    total_size = 0
-    
-    for i, file_path in enumerate(files, 1):
-        if file_path.is_file():
-            size = file_path.stat().st_size
-            total_size += size
-            file_list.append(f"{i}. `{file_path.name}` ({format_file_size(size)})")
+    total_size = sum(size for _, size in files)
+    file_list = "\n".join(
+        f"{i}. `{name}` ({format_size(size, STORAGE_SIZE_UNITS)})"
+        for i, (name, size) in enumerate(files, 1)
+    )
     
     message = (
-        f"📁 **Your Storage** ({len(file_list)} files)\n"
-        f"💾 Total size: {format_file_size(total_size)}\n\n"
-        + "\n".join(file_list) +
-        "\n\n**Commands:**\n"
+        f"📁 **Your Storage** ({len(files)} files)\n"
+        f"💾 Total size: {format_size(total_size, STORAGE_SIZE_UNITS)}\n\n"
+        f"{file_list}\n\n"
+        "**Commands:**\n"
         "`/delete <filename>` - Delete a specific file\n"
         "`/clear` - Delete all files"
     )
@@ -76,7 +115,7 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     Deletes a specific file from user's storage.
     """
     user_id = update.effective_user.id
-    user_dir = get_user_storage_dir(user_id)
+    get_user_storage_dir(user_id)
     
     # Get filename from command arguments
     if not context.args:
@@ -89,13 +128,12 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     filename = " ".join(context.args)
-    file_path = user_dir / filename
     
     # Security check: ensure file is within user's directory
     try:
-        file_path = file_path.resolve()
-        user_dir = user_dir.resolve()
-        if not str(file_path).startswith(str(user_dir)):
+        user_root = _resolved_user_dir(user_id)
+        file_path = (user_root / filename).resolve()
+        if file_path == user_root or not file_path.is_relative_to(user_root):
             raise ValueError("Invalid path")
     except:
         await update.message.reply_text(
@@ -134,7 +172,9 @@ async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     user_id = update.effective_user.id
     user_dir = get_user_storage_dir(user_id)
     
-    files = list(user_dir.iterdir())
+    # is_file() comes from the directory entry's type, no stat needed
+    with os.scandir(user_dir) as it:
+        files = [Path(entry.path) for entry in it if entry.is_file(follow_symlinks=False)]
     
     if not files:
         await update.message.reply_text(
@@ -145,9 +185,8 @@ async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     
     deleted_count = 0
     for file_path in files:
-        if file_path.is_file():
-            if await secure_delete(file_path):
-                deleted_count += 1
+        if await secure_delete(file_path):
+            deleted_count += 1
     
     await update.message.reply_text(
         f"🗑️ **Storage cleared!**\n\n"
@@ -170,25 +209,19 @@ async def save_file_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     await query.edit_message_text("💾 **Saving to storage...**", parse_mode="Markdown")
     
+    save_path = None
     try:
-        # Download the file
-        file = await context.bot.get_file(pending_file['file_id'])
         user_dir = get_user_storage_dir(user_id)
+        save_path = reserve_save_path(user_dir, pending_file['filename'])
         
-        # Create unique filename if file already exists
-        filename = pending_file['filename']
-        save_path = user_dir / filename
-        
-        counter = 1
-        while save_path.exists():
-            name_parts = filename.rsplit('.', 1)
-            if len(name_parts) == 2:
-                save_path = user_dir / f"{name_parts[0]}_{counter}.{name_parts[1]}"
-            else:
-                save_path = user_dir / f"{filename}_{counter}"
-            counter += 1
-        
-        await file.download_to_drive(str(save_path))
+        prefetched = await take_prefetched_file(context)
+        if prefetched:
+            # Move the copy prefetched during rights confirmation into place
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, shutil.move, prefetched, save_path)
+        else:
+            file = await context.bot.get_file(pending_file['file_id'])
+            await stream_to_disk(file, save_path)
         
         # Clear pending file
         context.user_data.pop('pending_file', None)
@@ -202,6 +235,12 @@ async def save_file_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
     except Exception as e:
         context.user_data.pop('pending_file', None)
+        discard_prefetch(context)
+        
+        # Don't leave the reserved (possibly partial) file in storage
+        if save_path:
+            with contextlib.suppress(OSError):
+                os.remove(save_path)
         
         await query.edit_message_text(
             f"❌ **Failed to save file:**\n`{str(e)}`",
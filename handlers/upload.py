@@ -3,13 +3,120 @@ File upload handlers for the Telegram bot.
 Handles document, video, and audio uploads with rights confirmation.
 """
 
+import asyncio
 from pathlib import Path
+from typing import Dict, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from config import SUPPORTED_FORMATS, COPYRIGHT_REMINDER, MAX_FILE_SIZE_MB
+from config import (
+    SUPPORTED_FORMATS,
+    SUPPORTED_VIDEO_FORMATS,
+    SUPPORTED_AUDIO_FORMATS,
+    COPYRIGHT_REMINDER,
+    MAX_FILE_SIZE_MB,
+    USE_LOCAL_API,
+)
 from utils.validators import validate_file_format, validate_file_size, get_file_extension
-from services.cleanup import generate_temp_filename
+from services.cleanup import generate_temp_filename, schedule_secure_delete
+from services.streaming import stream_to_disk
+
+# Static parts of the validation error replies
+SUPPORTED_FORMATS_LINE = f"Supported formats: {', '.join(SUPPORTED_FORMATS)}"
+FILE_TOO_LARGE_PREFIX = (
+    "❌ **File too large!**\n\n"
+    f"Maximum file size: {MAX_FILE_SIZE_MB} MB\n"
+)
+
+# Extensions that get the video or audio action buttons
+VIDEO_EXTS = frozenset(SUPPORTED_VIDEO_FORMATS)
+AUDIO_EXTS = frozenset(SUPPORTED_AUDIO_FORMATS)
+
+# Prefetches allowed to run at the same time for one user
+PREFETCH_PER_USER = 2
+
+# Seconds a prefetched copy is kept if the user never picks an action
+PREFETCH_TTL = 15 * 60
+
+# Per-user prefetch semaphores and the number of prefetches holding or
+# waiting on each; a user's entry is dropped once nothing uses it
+_prefetch_slots: Dict[int, asyncio.Semaphore] = {}
+_prefetch_users: Dict[int, int] = {}
+
+
+async def _prefetch(bot, user_id: int, file_id: str, filename: str) -> Path:
+    """Download an uploaded file to the user's temp dir ahead of time."""
+    slot = _prefetch_slots.get(user_id)
+    if slot is None:
+        slot = _prefetch_slots[user_id] = asyncio.Semaphore(PREFETCH_PER_USER)
+    _prefetch_users[user_id] = _prefetch_users.get(user_id, 0) + 1
+    try:
+        async with slot:
+            file = await bot.get_file(file_id)
+            temp_path = generate_temp_filename(user_id, filename)
+            try:
+                await stream_to_disk(file, temp_path)
+            except BaseException:
+                # Cancelled or failed; don't leave a partial file behind
+                schedule_secure_delete(temp_path)
+                raise
+            return temp_path
+    finally:
+        _prefetch_users[user_id] -= 1
+        if not _prefetch_users[user_id]:
+            del _prefetch_users[user_id]
+            del _prefetch_slots[user_id]
+
+
+def _delete_prefetched(task: asyncio.Task) -> None:
+    """Delete the file of a discarded prefetch once it has finished."""
+    if not task.cancelled() and task.exception() is None:
+        schedule_secure_delete(task.result())
+
+
+def _pop_prefetch(user_data: dict) -> Optional[asyncio.Task]:
+    """Remove the pending file's prefetch and stop its expiry timer."""
+    expiry = user_data.pop('prefetch_expiry', None)
+    if expiry is not None:
+        expiry.cancel()
+    return user_data.pop('prefetch', None)
+
+
+def discard_prefetch(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Cancel the pending file's prefetch, deleting anything it downloaded."""
+    task = _pop_prefetch(context.user_data)
+    if task is not None:
+        task.cancel()
+        task.add_done_callback(_delete_prefetched)
+
+
+def _expire_prefetch(user_data: dict, task: asyncio.Task) -> None:
+    """Discard a prefetch left unclaimed for PREFETCH_TTL seconds."""
+    # Actions started after this fall back to downloading the file
+    if user_data.get('prefetch') is task:
+        del user_data['prefetch']
+        user_data.pop('prefetch_expiry', None)
+        task.cancel()
+        task.add_done_callback(_delete_prefetched)
+
+
+async def take_prefetched_file(context: ContextTypes.DEFAULT_TYPE) -> Optional[Path]:
+    """
+    Claim the file prefetched for the pending upload.
+    
+    The caller becomes responsible for deleting the returned file.
+    
+    Returns:
+        Path to the downloaded file, or None if there was no prefetch
+        or it failed (the caller should download the file itself)
+    """
+    task = _pop_prefetch(context.user_data)
+    if task is None:
+        return None
+    try:
+        return await task
+    except Exception:
+        return None
 
 
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -59,13 +166,12 @@ async def _process_upload(
     """
     user_id = update.effective_user.id
     
+    ext = get_file_extension(filename)
+    
     # Validate file format
     if not validate_file_format(filename):
-        ext = get_file_extension(filename)
-        supported = ", ".join(SUPPORTED_FORMATS)
         await update.message.reply_text(
-            f"❌ **Unsupported file format:** `{ext}`\n\n"
-            f"Supported formats: {supported}",
+            f"❌ **Unsupported file format:** `{ext}`\n\n{SUPPORTED_FORMATS_LINE}",
             parse_mode="Markdown"
         )
         return
@@ -73,17 +179,18 @@ async def _process_upload(
     # Validate file size
     if not validate_file_size(file_size):
         await update.message.reply_text(
-            f"❌ **File too large!**\n\n"
-            f"Maximum file size: {MAX_FILE_SIZE_MB} MB\n"
-            f"Your file: {file_size / (1024*1024):.1f} MB",
+            f"{FILE_TOO_LARGE_PREFIX}Your file: {file_size / (1024*1024):.1f} MB",
             parse_mode="Markdown"
         )
         return
     
     # Store file info in context for later use
+    discard_prefetch(context)
     context.user_data['pending_file'] = {
         'file_id': file_id,
         'filename': filename,
+        'stem': Path(filename).stem,  # Base name for converted outputs
+        'ext': ext,
         'file_size': file_size,
     }
     
@@ -124,14 +231,24 @@ async def rights_confirm_callback(update: Update, context: ContextTypes.DEFAULT_
         return
     
     filename = pending_file['filename']
-    ext = get_file_extension(filename)
+    ext = pending_file['ext']
     
-    # Determine available actions based on file type
-    video_extensions = ['.mp4', '.avi', '.mkv', '.mov', '.webm', '.flv']
-    audio_extensions = ['.mp3', '.wav', '.aac', '.flac', '.ogg', '.m4a']
+    # Start downloading while the user picks an action. Waiting for the
+    # confirmation means declined uploads are never fetched, and the local
+    # Bot API server already has the file on disk, so skip it there.
+    if not USE_LOCAL_API and 'prefetch' not in context.user_data:
+        task = asyncio.create_task(_prefetch(
+            context.bot, update.effective_user.id, pending_file['file_id'], filename
+        ))
+        context.user_data['prefetch'] = task
+        # Don't keep the copy forever if the user never taps a button
+        context.user_data['prefetch_expiry'] = asyncio.get_running_loop().call_later(
+            PREFETCH_TTL, _expire_prefetch, context.user_data, task
+        )
     
-    is_video = ext in video_extensions
-    is_audio = ext in audio_extensions
+    # Determine available actions based on file type
+    is_video = ext in VIDEO_EXTS
+    is_audio = ext in AUDIO_EXTS
     
     # Build action buttons
     buttons = [
@@ -180,6 +297,7 @@ async def rights_cancel_callback(update: Update, context: ContextTypes.DEFAULT_T
     
     # Clear pending file
     context.user_data.pop('pending_file', None)
+    discard_prefetch(context)
     
     await query.edit_message_text(
         "❌ **Operation cancelled.**\n\n"
@@ -195,6 +313,7 @@ async def action_cancel_callback(update: Update, context: ContextTypes.DEFAULT_T
     
     # Clear pending file
     context.user_data.pop('pending_file', None)
+    discard_prefetch(context)
     
     await query.edit_message_text(
         "✅ **Operation cancelled.**\n\n"
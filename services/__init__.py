@@ -1,15 +1,15 @@
 """Services package for media processing operations."""
 
-from .converter import convert_media, convert_to_audio, convert_video_quality
-from .extractor import extract_metadata, extract_audio
+from .converter import convert_media, convert_to_audio, convert_video_quality, extract_and_transcode
+from .extractor import extract_metadata
 from .cleanup import secure_delete, cleanup_temp_files, cleanup_user_temp
 
 __all__ = [
     "convert_media",
     "convert_to_audio",
     "convert_video_quality",
+    "extract_and_transcode",
     "extract_metadata",
-    "extract_audio",
     "secure_delete",
     "cleanup_temp_files",
     "cleanup_user_temp",
@@ -3,19 +3,167 @@ Secure file cleanup service for the Telegram Media Bot.
 Handles secure deletion and temp file management.
 """
 
+import functools
 import os
 import secrets
+import sys
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Set
 import asyncio
-import aiofiles
+import aiofiles.os
 
-from config import TEMP_DIR
+from config import TEMP_DIR, SECURE_DELETE_MODE
+
+# User directories cleaned at the same time by cleanup_temp_files
+CLEANUP_CONCURRENCY = 16
+
+# Background deletions that are still running, awaited on shutdown
+_pending_deletes: Set[asyncio.Task] = set()
+
+# Seconds after a deletion before fstrim runs, so a burst of deletions
+# is trimmed in one go
+TRIM_DELAY = 60
+
+# Pending delayed trim, if one is scheduled
+_trim_task: Optional[asyncio.Task] = None
+
+
+def _find_mountpoint(path: Path) -> Path:
+    """Return the mountpoint of the filesystem containing `path`."""
+    path = path.resolve()
+    while not os.path.ismount(path):
+        path = path.parent
+    return path
+
+
+# Resolved once so each cleanup cycle can TRIM without walking the tree again
+TEMP_MOUNTPOINT = _find_mountpoint(TEMP_DIR)
+
+# Block device details are only read from Linux's sysfs
+_HAS_SYSFS = sys.platform.startswith("linux")
+
+
+def _is_discarding_crypt_volume(path: Path) -> bool:
+    """
+    Check whether `path` lives on a dm-crypt (LUKS) volume that passes discards through.
+    Unlinked blocks there are discarded and unreadable without the key, so overwriting adds nothing.
+    """
+    if not _HAS_SYSFS:
+        return False
+    device = os.stat(path).st_dev
+    base = Path(f"/sys/dev/block/{os.major(device)}:{os.minor(device)}")
+    try:
+        is_crypt = (base / "dm" / "uuid").read_text().startswith("CRYPT-")
+        discard_max = int((base / "queue" / "discard_max_bytes").read_text())
+    except (OSError, ValueError):
+        return False
+    return is_crypt and discard_max > 0
+
+
+# Set by probe_fast_delete at startup; when True, paranoid mode skips the overwrite
+FAST_DELETE_OK = False
+
+
+def probe_fast_delete() -> bool:
+    """Check once whether TEMP_DIR is on a discarding encrypted volume and remember the result."""
+    global FAST_DELETE_OK
+    FAST_DELETE_OK = _is_discarding_crypt_volume(TEMP_DIR)
+    return FAST_DELETE_OK
+
+
+# Largest single write while wiping a file
+WIPE_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB
+
+_urandom_fd: Optional[int] = None
+_use_sendfile = hasattr(os, "sendfile")
+
+# One wipe buffer per worker thread, since overwrites run via asyncio.to_thread
+_wipe_buffers = threading.local()
+
+
+@functools.lru_cache(maxsize=None)
+def _is_rotational(device: int) -> bool:
+    """Check sysfs for whether a block device is a spinning disk (assumes yes if unknown)."""
+    if not _HAS_SYSFS:
+        return True
+    base = Path(f"/sys/dev/block/{os.major(device)}:{os.minor(device)}")
+    # Partitions keep their queue settings on the parent disk
+    for queue in (base / "queue", base / ".." / "queue"):
+        try:
+            return (queue / "rotational").read_text().strip() == "1"
+        except OSError:
+            continue
+    return True
+
+
+def _urandom() -> int:
+    """Get the shared read-only descriptor for /dev/urandom."""
+    global _urandom_fd
+    if _urandom_fd is None:
+        _urandom_fd = os.open("/dev/urandom", os.O_RDONLY)
+    return _urandom_fd
+
+
+def _wipe_buffer() -> memoryview:
+    """Get this thread's reusable random-data buffer, allocating it on first use."""
+    buf = getattr(_wipe_buffers, "buf", None)
+    if buf is None:
+        buf = _wipe_buffers.buf = memoryview(bytearray(WIPE_CHUNK_SIZE))
+    return buf
+
+
+def _write_random(fd: int, count: int) -> int:
+    """Write up to `count` random bytes at the current offset of `fd`."""
+    global _use_sendfile
+    if _use_sendfile:
+        try:
+            # Kernel-to-kernel copy, no Python bytes objects involved
+            written = os.sendfile(fd, _urandom(), None, count)
+            if written > 0:
+                return written
+        except OSError:
+            pass
+        # Older kernels can't splice from /dev/urandom
+        _use_sendfile = False
+    
+    # Refill the same buffer for every chunk, pass and file
+    view = _wipe_buffer()[:count]
+    filled = os.readv(_urandom(), [view])
+    return os.write(fd, view[:filled])
+
+
+def _overwrite(file_path: Path, passes: int = 3) -> None:
+    """
+    Overwrite a file in place with random data, flushing each pass to disk.
+    Skipped on non-rotational devices, where the writes would land on remapped blocks.
+    """
+    fd = os.open(file_path, os.O_WRONLY)
+    try:
+        stat = os.fstat(fd)
+        if not _is_rotational(stat.st_dev):
+            return
+        
+        for _ in range(passes):
+            os.lseek(fd, 0, os.SEEK_SET)
+            remaining = stat.st_size
+            while remaining > 0:
+                remaining -= _write_random(fd, min(WIPE_CHUNK_SIZE, remaining))
+            os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
 async def secure_delete(file_path: Path) -> bool:
     """
-    Securely delete a file by overwriting with random data before deletion.
+    Delete a file.
+    
+    In "paranoid-hdd" mode a file on a spinning disk is overwritten with
+    random data first (in a worker thread), unless TEMP_DIR is on an
+    encrypted volume with discards enabled. Otherwise it is just unlinked;
+    on SSDs an overwrite lands on remapped blocks anyway, and the freed
+    blocks are discarded by a `trim_temp_filesystem` run scheduled
+    TRIM_DELAY seconds later.
     
     Args:
         file_path: Path to the file to delete
@@ -24,37 +172,93 @@ async def secure_delete(file_path: Path) -> bool:
         True if deletion was successful, False otherwise
     """
     try:
-        if not file_path.exists():
+        if not await aiofiles.os.path.exists(file_path):
             return True
-            
-        # Get file size
-        file_size = file_path.stat().st_size
         
-        # Overwrite with random data (3 passes for security)
-        for _ in range(3):
-            async with aiofiles.open(file_path, 'wb') as f:
-                # Write random bytes in chunks to avoid memory issues
-                chunk_size = min(file_size, 1024 * 1024)  # 1MB chunks
-                remaining = file_size
-                while remaining > 0:
-                    write_size = min(chunk_size, remaining)
-                    await f.write(secrets.token_bytes(write_size))
-                    remaining -= write_size
+        if SECURE_DELETE_MODE == "paranoid-hdd" and not FAST_DELETE_OK:
+            await asyncio.to_thread(_overwrite, file_path)
         
         # Delete the file
-        file_path.unlink()
+        await aiofiles.os.remove(file_path)
+        schedule_trim()
         return True
         
     except Exception as e:
         print(f"Error securely deleting {file_path}: {e}")
         # Try normal deletion as fallback
         try:
-            file_path.unlink()
+            await aiofiles.os.remove(file_path)
             return True
         except:
             return False
 
 
+async def trim_temp_filesystem() -> bool:
+    """
+    Discard freed blocks on the filesystem holding TEMP_DIR with `fstrim`.
+    
+    Returns:
+        True if fstrim succeeded, False if it is unavailable or not permitted
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            'fstrim', str(TEMP_MOUNTPOINT),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        return await process.wait() == 0
+    except FileNotFoundError:
+        return False
+
+
+async def _delayed_trim() -> None:
+    """Run fstrim once TRIM_DELAY seconds have passed."""
+    await asyncio.sleep(TRIM_DELAY)
+    await trim_temp_filesystem()
+
+
+def schedule_trim() -> None:
+    """
+    Trim the temp filesystem TRIM_DELAY seconds from now.
+    
+    Does nothing if a trim is already scheduled, so deletions made in the
+    meantime share it.
+    """
+    global _trim_task
+    if _trim_task is None or _trim_task.done():
+        _trim_task = asyncio.create_task(_delayed_trim())
+
+
+def schedule_secure_delete(file_path: Path) -> None:
+    """
+    Securely delete a file in the background.
+    
+    Lets handlers return without waiting for large files to be wiped.
+    
+    Args:
+        file_path: Path to the file to delete
+    """
+    task = asyncio.create_task(secure_delete(file_path))
+    _pending_deletes.add(task)
+    task.add_done_callback(_pending_deletes.discard)
+
+
+async def wait_pending_deletes() -> None:
+    """Wait for all background deletions to finish, then trim right away."""
+    if _pending_deletes:
+        await asyncio.gather(*_pending_deletes, return_exceptions=True)
+    
+    if _trim_task is not None and not _trim_task.done():
+        _trim_task.cancel()
+        await trim_temp_filesystem()
+
+
+def _list_files(directory: Path) -> List[Path]:
+    """List the regular files in a directory (blocking)."""
+    with os.scandir(directory) as it:
+        return [Path(entry.path) for entry in it if entry.is_file(follow_symlinks=False)]
+
+
 async def cleanup_user_temp(user_id: int) -> int:
     """
     Clean up all temporary files for a specific user.
@@ -68,26 +272,55 @@ async def cleanup_user_temp(user_id: int) -> int:
     user_temp_dir = TEMP_DIR / str(user_id)
     deleted_count = 0
     
-    if not user_temp_dir.exists():
+    if not await aiofiles.os.path.exists(user_temp_dir):
         return 0
     
-    for file_path in user_temp_dir.iterdir():
-        if file_path.is_file():
-            if await secure_delete(file_path):
-                deleted_count += 1
+    for file_path in await asyncio.to_thread(_list_files, user_temp_dir):
+        if await secure_delete(file_path):
+            deleted_count += 1
     
     # Try to remove the user's temp directory if empty
     try:
-        user_temp_dir.rmdir()
+        await aiofiles.os.rmdir(user_temp_dir)
     except OSError:
         pass  # Directory not empty or other error
     
     return deleted_count
 
 
+def _expired_files(user_dir: str, cutoff: float) -> List[Path]:
+    """List files in a user's temp dir last modified before `cutoff` (blocking)."""
+    expired = []
+    with os.scandir(user_dir) as it:
+        for entry in it:
+            if entry.is_file(follow_symlinks=False):
+                try:
+                    if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                        expired.append(Path(entry.path))
+                except Exception as e:
+                    print(f"Error checking file {entry.path}: {e}")
+    return expired
+
+
+async def _cleanup_user_dir(user_dir: str, cutoff: float, semaphore: asyncio.Semaphore) -> int:
+    """Delete a user's expired temp files and remove the directory if it ends up empty."""
+    async with semaphore:
+        expired = await asyncio.to_thread(_expired_files, user_dir, cutoff)
+        results = await asyncio.gather(*map(secure_delete, expired))
+        
+        # Try to remove empty user directories
+        try:
+            await aiofiles.os.rmdir(user_dir)
+        except OSError:
+            pass
+        
+        return sum(results)
+
+
 async def cleanup_temp_files(max_age_hours: int = 1) -> int:
     """
     Clean up old temporary files from all users.
+    Up to CLEANUP_CONCURRENCY user directories are processed at once.
     
     Args:
         max_age_hours: Maximum age of files to keep in hours
@@ -97,34 +330,23 @@ async def cleanup_temp_files(max_age_hours: int = 1) -> int:
     """
     import time
     
-    deleted_count = 0
-    max_age_seconds = max_age_hours * 3600
-    current_time = time.time()
+    cutoff = time.time() - max_age_hours * 3600
     
     if not TEMP_DIR.exists():
         return 0
     
-    for user_dir in TEMP_DIR.iterdir():
-        if not user_dir.is_dir():
-            continue
-            
-        for file_path in user_dir.iterdir():
-            if file_path.is_file():
-                try:
-                    file_age = current_time - file_path.stat().st_mtime
-                    if file_age > max_age_seconds:
-                        if await secure_delete(file_path):
-                            deleted_count += 1
-                except Exception as e:
-                    print(f"Error checking file {file_path}: {e}")
-        
-        # Try to remove empty user directories
-        try:
-            user_dir.rmdir()
-        except OSError:
-            pass
+    with os.scandir(TEMP_DIR) as it:
+        user_dirs = [entry.path for entry in it if entry.is_dir(follow_symlinks=False)]
     
-    return deleted_count
+    semaphore = asyncio.Semaphore(CLEANUP_CONCURRENCY)
+    counts = await asyncio.gather(
+        *(_cleanup_user_dir(user_dir, cutoff, semaphore) for user_dir in user_dirs)
+    )
+    
+    # Discard blocks freed by this cycle and by deletions since the last one
+    await trim_temp_filesystem()
+    
+    return sum(counts)
 
 
 def get_user_temp_dir(user_id: int) -> Path:
@@ -3,11 +3,126 @@ Media conversion service using FFmpeg.
 Handles format conversion and quality adjustments.
 """
 
-import asyncio
 from pathlib import Path
-from typing import Optional, Callable
+from typing import Dict, List, Optional, Callable, Tuple
 
-from config import AUDIO_QUALITY_PRESETS, VIDEO_QUALITY_PRESETS
+from config import AUDIO_QUALITY_PRESETS, VIDEO_QUALITY_PRESETS, VAAPI_DEVICE
+from services.extractor import probe_codecs
+from services.ffmpeg import FFMPEG, hw_encoder, run_ffmpeg
+
+# Audio codec used for each output format
+AUDIO_CODECS = {
+    "mp3": "libmp3lame",
+    "aac": "aac",
+    "ogg": "libvorbis",
+    "flac": "flac",
+    "wav": "pcm_s16le",
+}
+
+# Formats encoded without a target bitrate
+LOSSLESS_FORMATS = frozenset({"flac", "wav"})
+
+# Placeholders in command templates, replaced with the real paths per call
+IN_TOKEN = "__IN__"
+OUT_TOKEN = "__OUT__"
+
+
+def _audio_template(audio_format: str, bitrate: Optional[str]) -> Tuple[str, ...]:
+    """Build the extract-and-encode command template for a format and bitrate."""
+    codec = AUDIO_CODECS.get(audio_format, "libmp3lame")
+    return (
+        FFMPEG,
+        '-nostdin',  # Don't read the bot's stdin
+        '-i', IN_TOKEN,
+        '-map', 'a:0',  # Only decode the first audio stream
+        '-vn',  # No video
+        '-acodec', codec,
+        # FLAC and WAV don't need bitrate
+        *(('-ab', bitrate) if bitrate and audio_format not in LOSSLESS_FORMATS else ()),
+        '-y',
+        OUT_TOKEN,
+    )
+
+
+# Templates for every format at every preset bitrate, built once at import
+_AUDIO_CMDS: Dict[Tuple[str, str], Tuple[str, ...]] = {
+    (audio_format, preset.bitrate): _audio_template(audio_format, preset.bitrate)
+    for audio_format in AUDIO_CODECS
+    for preset in AUDIO_QUALITY_PRESETS.values()
+}
+
+
+def _fill(template: Tuple[str, ...], input_path: Path, output_path: Path) -> List[str]:
+    """Turn a command template into a command for the given files."""
+    paths = {IN_TOKEN: str(input_path), OUT_TOKEN: str(output_path)}
+    return [paths.get(arg, arg) for arg in template]
+
+
+# Arguments per H.264 encoder backend (None = libx264):
+# (input options, filter appended after scaling, codec options)
+VIDEO_ENCODERS = {
+    "nvenc": (
+        ['-hwaccel', 'cuda'],
+        None,
+        ['-c:v', 'h264_nvenc', '-preset', 'p4', '-cq', '23'],
+    ),
+    "vaapi": (
+        ['-vaapi_device', VAAPI_DEVICE],
+        'format=nv12,hwupload',
+        ['-c:v', 'h264_vaapi', '-qp', '23'],
+    ),
+    None: (
+        [],
+        None,
+        ['-c:v', 'libx264', '-preset', 'medium', '-crf', '23'],
+    ),
+}
+
+# Audio/video codecs each output container can hold as-is, so a change of
+# container alone can be done with a stream copy instead of a re-encode
+CONTAINER_CODECS = {
+    ".mp4": frozenset({"h264", "hevc", "av1", "mpeg4", "aac", "mp3", "alac", "opus"}),
+    ".mov": frozenset({"h264", "hevc", "mpeg4", "prores", "aac", "mp3", "alac", "pcm_s16le"}),
+    ".mkv": frozenset({
+        "h264", "hevc", "av1", "vp8", "vp9", "mpeg4", "aac", "mp3",
+        "opus", "vorbis", "flac", "ac3", "eac3", "pcm_s16le",
+    }),
+    ".webm": frozenset({"vp8", "vp9", "av1", "opus", "vorbis"}),
+}
+
+# Containers that benefit from moving the index to the front for streaming
+FASTSTART_CONTAINERS = frozenset({".mp4", ".mov"})
+
+
+async def can_stream_copy(input_path: Path, output_path: Path) -> bool:
+    """
+    Check whether every audio/video stream of the input fits the output container.
+    
+    Args:
+        input_path: Path to input file
+        output_path: Path for output file (extension determines the container)
+        
+    Returns:
+        True if the conversion can be done with `-c copy`
+    """
+    allowed = CONTAINER_CODECS.get(output_path.suffix.lower())
+    if not allowed:
+        return False
+    
+    try:
+        codecs = await probe_codecs(input_path)
+    except Exception:
+        return False  # Let the re-encode path report the real error
+    
+    return bool(codecs) and all(codec in allowed for codec in codecs)
+
+
+def _stream_copy_cmd(input_path: Path, output_path: Path) -> List[str]:
+    """Build a remux command that copies audio/video and drops other streams."""
+    cmd = [FFMPEG, '-i', str(input_path), '-c', 'copy', '-sn', '-dn']
+    if output_path.suffix.lower() in FASTSTART_CONTAINERS:
+        cmd += ['-movflags', '+faststart']
+    return cmd + ['-y', str(output_path)]
 
 
 async def convert_media(
@@ -27,30 +142,56 @@ async def convert_media(
         Path to converted file
     """
     try:
-        cmd = [
-            'ffmpeg',
-            '-i', str(input_path),
-            '-y',  # Overwrite output
-            str(output_path)
-        ]
+        if await can_stream_copy(input_path, output_path):
+            # Only the container changes; remux at disk speed
+            cmd = _stream_copy_cmd(input_path, output_path)
+        else:
+            cmd = [
+                FFMPEG,
+                '-i', str(input_path),
+                '-y',  # Overwrite output
+                str(output_path)
+            ]
         
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        await run_ffmpeg(cmd)
         
-        stdout, stderr = await process.communicate()
+        return output_path
         
-        if process.returncode != 0:
-            raise Exception(f"FFmpeg error: {stderr.decode()}")
+    except FileNotFoundError:
+        raise Exception("FFmpeg not found. Please install FFmpeg.")
+    except Exception as e:
+        raise Exception(f"Conversion failed: {str(e)}")
+
+
+async def extract_and_transcode(
+    input_path: Path,
+    output_path: Path,
+    audio_format: str = "mp3",
+    bitrate: Optional[str] = "192k"
+) -> Path:
+    """
+    Extract the audio stream and encode it to the target format in one FFmpeg pass.
+    
+    Args:
+        input_path: Path to input file (audio or video)
+        output_path: Path for output audio file
+        audio_format: Output audio format ("mp3", "aac", "ogg", "flac", "wav")
+        bitrate: Audio bitrate (e.g., "192k"); ignored for lossless formats
+        
+    Returns:
+        Path to the encoded audio file
+    """
+    template = _AUDIO_CMDS.get((audio_format, bitrate)) or _audio_template(audio_format, bitrate)
+    
+    try:
+        await run_ffmpeg(_fill(template, input_path, output_path))
         
         return output_path
         
     except FileNotFoundError:
         raise Exception("FFmpeg not found. Please install FFmpeg.")
     except Exception as e:
-        raise Exception(f"Conversion failed: {str(e)}")
+        raise Exception(f"Audio conversion failed: {str(e)}")
 
 
 async def convert_to_audio(
@@ -71,58 +212,71 @@ async def convert_to_audio(
     Returns:
         Path to converted audio file
     """
-    preset = AUDIO_QUALITY_PRESETS.get(quality, AUDIO_QUALITY_PRESETS["medium"])
-    bitrate = preset["bitrate"]
-    
-    try:
-        # Determine audio codec based on format
-        codec_map = {
-            "mp3": "libmp3lame",
-            "aac": "aac",
-            "ogg": "libvorbis",
-            "flac": "flac",
-            "wav": "pcm_s16le"
-        }
-        codec = codec_map.get(output_format, "libmp3lame")
-        
-        cmd = [
-            'ffmpeg',
-            '-i', str(input_path),
-            '-vn',  # No video
-            '-acodec', codec,
-            '-ab', bitrate,
-            '-y',
-            str(output_path)
-        ]
-        
-        # FLAC and WAV don't need bitrate
-        if output_format in ["flac", "wav"]:
-            cmd = [
-                'ffmpeg',
-                '-i', str(input_path),
-                '-vn',
-                '-acodec', codec,
-                '-y',
-                str(output_path)
-            ]
-        
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
-        
-        if process.returncode != 0:
-            raise Exception(f"FFmpeg error: {stderr.decode()}")
-        
-        return output_path
-        
-    except FileNotFoundError:
-        raise Exception("FFmpeg not found. Please install FFmpeg.")
-    except Exception as e:
-        raise Exception(f"Audio conversion failed: {str(e)}")
+    preset = AUDIO_QUALITY_PRESETS.get(quality) or AUDIO_QUALITY_PRESETS["medium"]
+    return await extract_and_transcode(input_path, output_path, output_format, preset.bitrate)
+
+
+def _quality_template(resolution: str, encoder: Optional[str]) -> Tuple[str, ...]:
+    """Build the scale-and-pad encode command template for a resolution and encoder backend."""
+    width, height = resolution.split("x")
+    input_args, upload_filter, codec_args = VIDEO_ENCODERS[encoder]
+    filters = f'scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2'
+    if upload_filter:
+        filters += f',{upload_filter}'
+    return (
+        FFMPEG,
+        *input_args,
+        '-i', IN_TOKEN,
+        '-vf', filters,
+        *codec_args,
+        '-c:a', 'aac',
+        '-b:a', '192k',
+        '-y',
+        OUT_TOKEN,
+    )
+
+
+def _mp4_template(encoder: Optional[str]) -> Tuple[str, ...]:
+    """Build the MP4 re-encode command template for an encoder backend."""
+    input_args, upload_filter, codec_args = VIDEO_ENCODERS[encoder]
+    return (
+        FFMPEG,
+        *input_args,
+        '-i', IN_TOKEN,
+        *(('-vf', upload_filter) if upload_filter else ()),
+        *codec_args,
+        '-c:a', 'aac',
+        '-b:a', '192k',
+        '-movflags', '+faststart',
+        '-y',
+        OUT_TOKEN,
+    )
+
+
+# Video command templates for every preset and encoder backend, built once at import
+_VIDEO_QUALITY_CMDS: Dict[str, Dict[Optional[str], Tuple[str, ...]]] = {
+    quality: {encoder: _quality_template(preset.resolution, encoder) for encoder in VIDEO_ENCODERS}
+    for quality, preset in VIDEO_QUALITY_PRESETS.items()
+}
+_MP4_CMDS: Dict[Optional[str], Tuple[str, ...]] = {
+    encoder: _mp4_template(encoder) for encoder in VIDEO_ENCODERS
+}
+
+
+async def _encode_video(
+    templates: Dict[Optional[str], Tuple[str, ...]],
+    input_path: Path,
+    output_path: Path
+) -> None:
+    """Run a video encode on the hardware encoder, falling back to libx264 if it fails."""
+    encoder = await hw_encoder()
+    if encoder:
+        try:
+            await run_ffmpeg(_fill(templates[encoder], input_path, output_path))
+            return
+        except Exception:
+            pass  # e.g. a pixel format the hardware can't take; retry in software
+    await run_ffmpeg(_fill(templates[None], input_path, output_path))
 
 
 async def convert_video_quality(
@@ -141,34 +295,10 @@ async def convert_video_quality(
     Returns:
         Path to converted video file
     """
-    preset = VIDEO_QUALITY_PRESETS.get(quality, VIDEO_QUALITY_PRESETS["720p"])
-    resolution = preset["resolution"]
-    width, height = resolution.split("x")
+    templates = _VIDEO_QUALITY_CMDS.get(quality) or _VIDEO_QUALITY_CMDS["720p"]
     
     try:
-        cmd = [
-            'ffmpeg',
-            '-i', str(input_path),
-            '-vf', f'scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2',
-            '-c:v', 'libx264',
-            '-preset', 'medium',
-            '-crf', '23',
-            '-c:a', 'aac',
-            '-b:a', '192k',
-            '-y',
-            str(output_path)
-        ]
-        
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
-        
-        if process.returncode != 0:
-            raise Exception(f"FFmpeg error: {stderr.decode()}")
+        await _encode_video(templates, input_path, output_path)
         
         return output_path
         
@@ -193,29 +323,11 @@ async def convert_video_to_mp4(
         Path to converted MP4 file
     """
     try:
-        cmd = [
-            'ffmpeg',
-            '-i', str(input_path),
-            '-c:v', 'libx264',
-            '-preset', 'medium',
-            '-crf', '23',
-            '-c:a', 'aac',
-            '-b:a', '192k',
-            '-movflags', '+faststart',
-            '-y',
-            str(output_path)
-        ]
-        
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
-        
-        if process.returncode != 0:
-            raise Exception(f"FFmpeg error: {stderr.decode()}")
+        if await can_stream_copy(input_path, output_path):
+            # Already MP4-compatible codecs; remux at disk speed
+            await run_ffmpeg(_stream_copy_cmd(input_path, output_path))
+        else:
+            await _encode_video(_MP4_CMDS, input_path, output_path)
         
         return output_path
         
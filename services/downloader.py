@@ -4,21 +4,80 @@ Supports YouTube, Instagram, TikTok, and many other platforms.
 """
 
 import asyncio
+import functools
+import multiprocessing
 import os
+import re
+import shutil
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Dict, Any, Optional, Tuple
+from types import MappingProxyType
+from typing import Dict, Any, Optional, Set, Tuple
 import yt_dlp
 
-from config import TEMP_DIR, MAX_FILE_SIZE_MB, COOKIES_FROM_BROWSER, COOKIES_FILE, BASE_DIR, PROXY_URLS
+from config import (
+    TEMP_DIR, MAX_FILE_SIZE_MB, COOKIES_FROM_BROWSER, COOKIES_FILE, BASE_DIR, PROXY_URLS,
+    YTDLP_WORKERS, YTDLP_FRAG_CONCURRENCY,
+)
 
+# yt-dlp spends much of its time in Python (signature deciphering, fragment
+# merging), so it runs in worker processes rather than threads sharing the GIL.
+# Processes are only started on first use.
+# forkserver where available, because forking this process would copy the
+# state of its worker threads (aiofiles, to_thread) into the children;
+# elsewhere (Windows, macOS) the platform default already spawns fresh ones.
+if "forkserver" in multiprocessing.get_all_start_methods():
+    _YTDLP_MP_CONTEXT = multiprocessing.get_context("forkserver")
+else:
+    _YTDLP_MP_CONTEXT = multiprocessing.get_context()
 
-def get_cookie_opts(url: str = "") -> dict:
+
+def _new_ytdlp_pool() -> ProcessPoolExecutor:
+    """Create the pool of yt-dlp worker processes."""
+    return ProcessPoolExecutor(max_workers=YTDLP_WORKERS, mp_context=_YTDLP_MP_CONTEXT)
+
+
+_YTDLP_POOL = _new_ytdlp_pool()
+
+# Download options: fetch the fragments of segmented (HLS/DASH) media in
+# parallel with the native downloader, and hand plain HTTP(S) downloads to
+# aria2c's multi-connection client when it is installed (yt-dlp files
+# https under the 'http' key)
+PARALLEL_DOWNLOAD_OPTS = {
+    'concurrent_fragment_downloads': YTDLP_FRAG_CONCURRENCY,
+}
+if shutil.which('aria2c'):
+    PARALLEL_DOWNLOAD_OPTS.update({
+        'external_downloader': {'http': 'aria2c'},
+        'external_downloader_args': {'aria2c': ['-x', '16', '-s', '16', '-k', '1M']},
+    })
+
+
+def detect_platform(url: str) -> Optional[str]:
     """
-    Get yt-dlp options for cookie authentication.
-    Uses platform-specific cookies if available.
+    Detect the platforms that need special yt-dlp options from a URL.
     
     Args:
-        url: The URL being accessed (to determine which cookies to use)
+        url: The URL being accessed
+        
+    Returns:
+        "youtube", "instagram", or None for everything else
+    """
+    url_lower = url.lower()
+    if "youtube.com" in url_lower or "youtu.be" in url_lower:
+        return "youtube"
+    if "instagram.com" in url_lower or "instagr.am" in url_lower:
+        return "instagram"
+    return None
+
+
+def _build_cookie_opts(platform: Optional[str]) -> dict:
+    """
+    Build yt-dlp cookie options for a platform.
+    Uses platform-specific cookies if available.
     """
     opts = {}
     
@@ -27,7 +86,7 @@ def get_cookie_opts(url: str = "") -> dict:
     youtube_cookies = BASE_DIR / "cookies.txt"  # Default/YouTube cookies
     
     # Determine which cookie file to use based on URL
-    if "instagram.com" in url.lower() or "instagr.am" in url.lower():
+    if platform == "instagram":
         if instagram_cookies.exists():
             opts['cookiefile'] = str(instagram_cookies)
     else:
@@ -42,18 +101,50 @@ def get_cookie_opts(url: str = "") -> dict:
     return opts
 
 
-def get_download_opts(url: str = "", proxy_index: int = 0) -> dict:
+# Cookie options per platform, built once so requests don't stat the cookie
+# files. Only Instagram uses different cookies from everything else.
+_COOKIE_OPTS: Dict[Optional[str], dict] = {}
+
+
+def refresh_cookie_opts() -> None:
+    """Re-check the cookie files, e.g. after they were added or replaced."""
+    _COOKIE_OPTS.clear()
+    _COOKIE_OPTS["instagram"] = _build_cookie_opts("instagram")
+    _COOKIE_OPTS[None] = _build_cookie_opts(None)
+
+
+refresh_cookie_opts()
+
+
+def get_cookie_opts(url: str = "", platform: Optional[str] = None) -> dict:
+    """
+    Get yt-dlp options for cookie authentication.
+    Uses platform-specific cookies if available.
+    
+    Args:
+        url: The URL being accessed (to determine which cookies to use)
+        platform: Platform already detected by the caller, skips URL parsing
+    """
+    platform = platform or detect_platform(url)
+    key = "instagram" if platform == "instagram" else None
+    # Copy, since callers add their own options to the result
+    return dict(_COOKIE_OPTS[key])
+
+
+def get_download_opts(url: str = "", proxy_index: int = 0, platform: Optional[str] = None) -> dict:
     """
     Get yt-dlp options including cookies and proxy.
     
     Args:
         url: The URL being accessed
         proxy_index: Which proxy to use from PROXY_URLS list
+        platform: Platform already detected by the caller, skips URL parsing
     """
-    opts = get_cookie_opts(url)
+    platform = platform or detect_platform(url)
+    opts = get_cookie_opts(url, platform)
     
     # Add proxy and JS runtime for YouTube (they block datacenter IPs and require JS)
-    if "youtube.com" in url.lower() or "youtu.be" in url.lower():
+    if platform == "youtube":
         # Use Node.js for YouTube's JavaScript challenges
         opts['extractor_args'] = {'youtube': {'player_client': ['android_sdkless', 'web_safari']}}
         
@@ -64,25 +155,129 @@ def get_download_opts(url: str = "", proxy_index: int = 0) -> dict:
     return opts
 
 
+# How long fetched video info is reused for repeat requests of the same URL
+VIDEO_INFO_TTL = 300  # 5 minutes
+
+# Most URLs kept in the info cache; the least recently used is dropped first
+VIDEO_INFO_CACHE_SIZE = 512
+
+# Lookups in progress, so concurrent requests for one URL share a single yt-dlp call
+_info_inflight: Dict[str, asyncio.Future] = {}
+
+# Recently fetched video info: url -> (expiry time, info), oldest use first
+_info_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+
+# Users whose download directory has already been created
+_KNOWN_DIRS: Set[int] = set()
+
+
 def get_user_download_dir(user_id: int) -> Path:
     """Get or create a download directory for a specific user."""
     user_dir = TEMP_DIR / str(user_id) / "downloads"
-    user_dir.mkdir(parents=True, exist_ok=True)
+    if user_id not in _KNOWN_DIRS:
+        user_dir.mkdir(parents=True, exist_ok=True)
+        _KNOWN_DIRS.add(user_id)
     return user_dir
 
 
-async def get_video_info(url: str) -> Dict[str, Any]:
+def _picklable_error(error: Exception) -> Exception:
+    """
+    Turn a yt-dlp failure into an exception that can leave the worker process.
+    
+    DownloadError keeps exc_info (a traceback and yt-dlp's logger), which
+    can't be pickled, so only the message is carried over. Callers match on
+    the message text ("Sign in to confirm", "Private video", ...).
+    """
+    return yt_dlp.utils.DownloadError(str(error))
+
+
+def _extract_info(url: str, ydl_opts: dict) -> Dict[str, Any]:
+    """
+    Fetch video info in a yt-dlp worker process.
+    
+    Only the fields the bot uses are returned, so the result is cheap to
+    send back to the main process.
+    """
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        raise _picklable_error(e) from None
+    
+    return {
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration', 0),
+        'uploader': info.get('uploader', 'Unknown'),
+        'view_count': info.get('view_count', 0),
+        'platform': info.get('extractor', 'Unknown'),
+    }
+
+
+def _download(url: str, ydl_opts: dict, format_type: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Download a video in a yt-dlp worker process.
+    
+    Returns:
+        Tuple of (file path, video info) with only the fields the bot uses
+    """
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+            # Get the actual downloaded filename
+            if info.get('requested_downloads'):
+                filepath = info['requested_downloads'][0]['filepath']
+            else:
+                filepath = ydl.prepare_filename(info)
+                # Handle post-processor extension changes
+                if format_type == "audio":
+                    filepath = str(Path(filepath).with_suffix('.mp3'))
+    except Exception as e:
+        raise _picklable_error(e) from None
+    
+    return filepath, {
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration', 0),
+        'uploader': info.get('uploader', 'Unknown'),
+        'platform': info.get('extractor', 'Unknown'),
+    }
+
+
+async def _run_in_pool(func, *args):
+    """Run `func` in a yt-dlp worker process, replacing the pool once if it broke."""
+    global _YTDLP_POOL
+    loop = asyncio.get_running_loop()
+    pool = _YTDLP_POOL
+    try:
+        return await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        # A worker died (crash, OOM kill) and the executor refuses all further
+        # work; start a fresh one unless a concurrent call already has
+        if _YTDLP_POOL is pool:
+            pool.shutdown(wait=False)
+            _YTDLP_POOL = _new_ytdlp_pool()
+        return await loop.run_in_executor(_YTDLP_POOL, func, *args)
+
+
+def shutdown_ytdlp_pool() -> None:
+    """Stop the yt-dlp worker processes, abandoning queued work."""
+    _YTDLP_POOL.shutdown(wait=False, cancel_futures=True)
+
+
+async def get_video_info(url: str, platform: Optional[str] = None) -> Dict[str, Any]:
     """
     Get video information without downloading.
     Uses proxy fallback for YouTube URLs.
     
     Args:
         url: Video URL
+        platform: Platform already detected by the caller, skips URL parsing
         
     Returns:
         Dictionary with video metadata
     """
-    is_youtube = "youtube.com" in url.lower() or "youtu.be" in url.lower()
+    platform = platform or detect_platform(url)
+    is_youtube = platform == "youtube"
     max_retries = len(PROXY_URLS) if is_youtube and PROXY_URLS else 1
     last_error = None
     
@@ -91,27 +286,13 @@ async def get_video_info(url: str) -> Dict[str, Any]:
             'quiet': True,
             'no_warnings': True,
             'extract_flat': False,
-            **get_download_opts(url, proxy_index),
+            **get_download_opts(url, proxy_index, platform),
         }
         
-        def extract():
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                return ydl.extract_info(url, download=False)
-        
         try:
-            loop = asyncio.get_event_loop()
-            info = await loop.run_in_executor(None, extract)
-            
-            return {
-                'title': info.get('title', 'Unknown'),
-                'duration': info.get('duration', 0),
-                'uploader': info.get('uploader', 'Unknown'),
-                'view_count': info.get('view_count', 0),
-                'platform': info.get('extractor', 'Unknown'),
-                'thumbnail': info.get('thumbnail'),
-                'formats': info.get('formats', []),
-                'url': url,
-            }
+            info = await _run_in_pool(_extract_info, url, ydl_opts)
+            info['url'] = url
+            return info
         except Exception as e:
             last_error = e
             # If it's a bot detection error and we have more proxies, try next
@@ -124,11 +305,115 @@ async def get_video_info(url: str) -> Dict[str, Any]:
         raise last_error
 
 
+def _store_video_info(url: str, task: asyncio.Future) -> None:
+    """Move a finished lookup from the in-flight table into the cache."""
+    _info_inflight.pop(url, None)
+    if task.cancelled() or task.exception() is not None:
+        return
+    
+    now = time.monotonic()
+    for key in [k for k, (expires, _) in _info_cache.items() if expires <= now]:
+        del _info_cache[key]
+    _info_cache[url] = (now + VIDEO_INFO_TTL, task.result())
+    _info_cache.move_to_end(url)
+    while len(_info_cache) > VIDEO_INFO_CACHE_SIZE:
+        _info_cache.popitem(last=False)
+
+
+def evict_video_info(url: str) -> None:
+    """Drop cached info for a URL so the next request fetches it again."""
+    _info_cache.pop(url, None)
+
+
+async def fetch_video_info(url: str, platform: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Get video information, sharing lookups between users.
+    
+    Concurrent requests for the same URL wait on one yt-dlp extraction,
+    and the result is reused for VIDEO_INFO_TTL seconds (for at most
+    VIDEO_INFO_CACHE_SIZE URLs).
+    
+    Args:
+        url: Video URL
+        platform: Platform already detected by the caller, skips URL parsing
+        
+    Returns:
+        Dictionary with video metadata
+    """
+    cached = _info_cache.get(url)
+    if cached and cached[0] > time.monotonic():
+        _info_cache.move_to_end(url)
+        return cached[1]
+    
+    task = _info_inflight.get(url)
+    if task is None:
+        task = asyncio.ensure_future(get_video_info(url, platform))
+        _info_inflight[url] = task
+        task.add_done_callback(functools.partial(_store_video_info, url))
+    
+    # Shield so one user giving up doesn't cancel the lookup for the others
+    return await asyncio.shield(task)
+
+
+# Quality to height mapping
+QUALITY_HEIGHTS = {
+    "360p": 360,
+    "480p": 480,
+    "720p": 720,
+    "1080p": 1080,
+}
+
+# Download file name. restrictfilenames keeps it to plain ASCII with no
+# spaces, and the title is capped at 80 bytes rather than characters so
+# long non-Latin titles can't exceed the filesystem's name limit
+OUTPUT_TEMPLATE = '%(title).80B.%(ext)s'
+
+# Options shared by every download
+_BASE_DOWNLOAD_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'restrictfilenames': True,
+    'max_filesize': MAX_FILE_SIZE_MB * 1024 * 1024,
+    **PARALLEL_DOWNLOAD_OPTS,
+}
+
+# Per-format options, built once; download_video only adds the output
+# template and the cookie/proxy options. Each download gets a pickled copy
+# in its worker process, so the shared lists are never mutated.
+_AUDIO_DOWNLOAD_OPTS = MappingProxyType({
+    **_BASE_DOWNLOAD_OPTS,
+    # Any audio-only stream will do since it is transcoded to MP3 anyway;
+    # preferring m4a could pick a larger stream for no benefit
+    'format': 'bestaudio/best',
+    'postprocessors': [{
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': 'mp3',
+        'preferredquality': '192',
+    }],
+    'merge_output_format': None,
+})
+
+_VIDEO_DOWNLOAD_OPTS = {
+    quality: MappingProxyType({
+        **_BASE_DOWNLOAD_OPTS,
+        # Video format - limit by height
+        'format': f'bestvideo[height<={height}]+bestaudio/best[height<={height}]/best',
+        'postprocessors': [{
+            'key': 'FFmpegVideoConvertor',
+            'preferedformat': 'mp4',
+        }],
+        'merge_output_format': 'mp4',
+    })
+    for quality, height in QUALITY_HEIGHTS.items()
+}
+
+
 async def download_video(
     url: str,
     user_id: int,
     format_type: str = "best",
-    quality: str = "720p"
+    quality: str = "720p",
+    platform: Optional[str] = None
 ) -> Tuple[Path, Dict[str, Any]]:
     """
     Download video from URL.
@@ -138,91 +423,29 @@ async def download_video(
         user_id: Telegram user ID
         format_type: "video", "audio", or "best"
         quality: Video quality (360p, 480p, 720p, 1080p)
+        platform: Platform already detected by the caller, skips URL parsing
         
     Returns:
         Tuple of (file path, video info)
     """
-    download_dir = get_user_download_dir(user_id)
-    
-    # Quality to height mapping
-    quality_map = {
-        "360p": 360,
-        "480p": 480,
-        "720p": 720,
-        "1080p": 1080,
-    }
-    max_height = quality_map.get(quality, 720)
-    
-    # Configure download options based on format type
     if format_type == "audio":
-        format_spec = 'bestaudio[ext=m4a]/bestaudio/best'
-        ext = 'mp3'
-        postprocessors = [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }]
+        base_opts = _AUDIO_DOWNLOAD_OPTS
     else:
-        # Video format - limit by height
-        format_spec = f'bestvideo[height<={max_height}]+bestaudio/best[height<={max_height}]/best'
-        ext = 'mp4'
-        postprocessors = [{
-            'key': 'FFmpegVideoConvertor',
-            'preferedformat': 'mp4',
-        }]
+        base_opts = _VIDEO_DOWNLOAD_OPTS.get(quality) or _VIDEO_DOWNLOAD_OPTS["720p"]
     
     ydl_opts = {
-        'format': format_spec,
-        'outtmpl': str(download_dir / '%(title).50s.%(ext)s'),
-        'quiet': True,
-        'no_warnings': True,
-        'postprocessors': postprocessors,
-        'max_filesize': MAX_FILE_SIZE_MB * 1024 * 1024,
-        'merge_output_format': 'mp4' if format_type != "audio" else None,
-        **get_download_opts(url),  # Add cookie and proxy support
+        **base_opts,
+        'outtmpl': str(get_user_download_dir(user_id) / OUTPUT_TEMPLATE),
+        **get_download_opts(url, platform=platform),  # Add cookie and proxy support
     }
     
-    def download():
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            # Get the actual downloaded filename
-            if info.get('requested_downloads'):
-                filepath = info['requested_downloads'][0]['filepath']
-            else:
-                filepath = ydl.prepare_filename(info)
-                # Handle post-processor extension changes
-                if format_type == "audio":
-                    filepath = str(Path(filepath).with_suffix('.mp3'))
-            return filepath, info
-    
-    loop = asyncio.get_event_loop()
-    filepath, info = await loop.run_in_executor(None, download)
+    filepath, info = await _run_in_pool(_download, url, ydl_opts, format_type)
     
-    return Path(filepath), {
-        'title': info.get('title', 'Unknown'),
-        'duration': info.get('duration', 0),
-        'uploader': info.get('uploader', 'Unknown'),
-        'platform': info.get('extractor', 'Unknown'),
-    }
+    return Path(filepath), info
 
 
-def format_duration(seconds) -> str:
-    """Format duration in seconds to MM:SS or HH:MM:SS."""
-    if not seconds:
-        return "Unknown"
-    
-    try:
-        seconds = int(float(seconds))
-    except (ValueError, TypeError):
-        return "Unknown"
-    
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    secs = seconds % 60
-    
-    if hours > 0:
-        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
-    return f"{minutes:02d}:{secs:02d}"
+# View count thresholds, largest first
+VIEW_COUNT_UNITS = ((1_000_000_000, "B"), (1_000_000, "M"), (1_000, "K"))
 
 
 def format_views(count) -> str:
@@ -235,50 +458,48 @@ def format_views(count) -> str:
     except (ValueError, TypeError):
         return "Unknown"
     
-    if count >= 1_000_000_000:
-        return f"{count / 1_000_000_000:.1f}B"
-    elif count >= 1_000_000:
-        return f"{count / 1_000_000:.1f}M"
-    elif count >= 1_000:
-        return f"{count / 1_000:.1f}K"
+    for threshold, suffix in VIEW_COUNT_UNITS:
+        if count >= threshold:
+            return f"{count / threshold:.1f}{suffix}"
     return str(count)
 
 
+# Domains of the supported platforms, matched anywhere in the URL
+_SUPPORTED_RE = re.compile(
+    r'youtube\.com|youtu\.be|'
+    r'instagram\.com|instagr\.am|'
+    r'tiktok\.com|'
+    r'twitter\.com|x\.com|'
+    r'facebook\.com|fb\.watch|'
+    r'vimeo\.com|'
+    r'dailymotion\.com|'
+    r'twitch\.tv|'
+    r'reddit\.com|'
+    r'soundcloud\.com',
+    re.IGNORECASE
+)
+
+
 def is_supported_url(url: str) -> bool:
     """Check if URL is from a supported platform."""
-    supported_domains = [
-        'youtube.com', 'youtu.be', 'youtube.com/shorts',
-        'instagram.com', 'instagr.am',
-        'tiktok.com', 'vm.tiktok.com',
-        'twitter.com', 'x.com',
-        'facebook.com', 'fb.watch',
-        'vimeo.com',
-        'dailymotion.com',
-        'twitch.tv',
-        'reddit.com',
-        'soundcloud.com',
-    ]
-    
-    url_lower = url.lower()
-    return any(domain in url_lower for domain in supported_domains)
+    return _SUPPORTED_RE.search(url) is not None
+
+
+# Emoji per platform, matched by substring of the extractor name, most common first
+_PLATFORM_EMOJIS = (
+    ('youtube', '🔴'),
+    ('instagram', '📸'),
+    ('tiktok', '🎵'),
+    ('twitter', '🐦'),
+    ('facebook', '📘'),
+    ('vimeo', '🎬'),
+    ('twitch', '💜'),
+    ('reddit', '🤖'),
+    ('soundcloud', '🔊'),
+)
 
 
 def get_platform_emoji(platform: str) -> str:
     """Get emoji for platform."""
-    emojis = {
-        'youtube': '🔴',
-        'instagram': '📸',
-        'tiktok': '🎵',
-        'twitter': '🐦',
-        'facebook': '📘',
-        'vimeo': '🎬',
-        'twitch': '💜',
-        'reddit': '🤖',
-        'soundcloud': '🔊',
-    }
-    
-    platform_lower = platform.lower()
-    for key, emoji in emojis.items():
-        if key in platform_lower:
-            return emoji
-    return '🎥'
+    platform = platform.casefold()
+    return next((emoji for key, emoji in _PLATFORM_EMOJIS if key in platform), '🎥')
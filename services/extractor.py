@@ -2,11 +2,23 @@
 Metadata and audio extraction service using FFprobe/FFmpeg.
 """
 
-import json
+import math
 import subprocess
 import asyncio
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional
+import orjson
+
+from services.ffmpeg import FFMPEG, FFPROBE, ffmpeg_slot, quiet, with_threads
+from utils.formatters import format_duration, format_size
+
+
+# ffprobe fields read by extract_metadata
+METADATA_ENTRIES = (
+    "format=format_long_name,duration,size,bit_rate"
+    ":stream=codec_type,codec_name,codec_long_name,width,height,"
+    "r_frame_rate,sample_rate,channels"
+)
 
 
 async def extract_metadata(file_path: Path) -> Dict[str, Any]:
@@ -22,33 +34,35 @@ async def extract_metadata(file_path: Path) -> Dict[str, Any]:
     try:
         # Run ffprobe to get media info
         cmd = [
-            'ffprobe',
+            FFPROBE,
             '-v', 'quiet',
             '-print_format', 'json',
-            '-show_format',
-            '-show_streams',
+            # Only the fields used below, instead of every key of every stream
+            '-show_entries', METADATA_ENTRIES,
             str(file_path)
         ]
         
+        # "-v quiet" leaves nothing on stderr worth reading
         process = await asyncio.create_subprocess_exec(
             *cmd,
             stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+            stderr=asyncio.subprocess.DEVNULL
         )
         
-        stdout, stderr = await process.communicate()
+        stdout, _ = await process.communicate()
         
         if process.returncode != 0:
-            raise Exception(f"FFprobe error: {stderr.decode()}")
+            raise Exception(f"FFprobe exited with status {process.returncode}")
         
-        data = json.loads(stdout.decode())
+        data = orjson.loads(stdout)
         
         # Parse and format the metadata
+        size = int(data.get("format", {}).get("size", 0))
         metadata = {
             "filename": file_path.name,
             "format": data.get("format", {}).get("format_long_name", "Unknown"),
             "duration": format_duration(float(data.get("format", {}).get("duration", 0))),
-            "size": format_size(int(data.get("format", {}).get("size", 0))),
+            "size": format_size(size) if size > 0 else "Unknown",
             "bitrate": format_bitrate(int(data.get("format", {}).get("bit_rate", 0))),
             "streams": []
         }
@@ -78,16 +92,60 @@ async def extract_metadata(file_path: Path) -> Dict[str, Any]:
         raise Exception(f"Failed to extract metadata: {str(e)}")
 
 
-async def extract_audio(
-    input_path: Path, 
-    output_path: Path, 
+async def probe_codecs(file_path: Path) -> List[str]:
+    """
+    List the codecs of a file's audio and video streams.
+    
+    Args:
+        file_path: Path to the media file
+        
+    Returns:
+        Codec names (e.g. ["h264", "aac"]) in stream order
+    """
+    try:
+        cmd = [
+            FFPROBE,
+            '-v', 'error',
+            '-show_entries', 'stream=codec_type,codec_name',
+            '-of', 'json',
+            str(file_path)
+        ]
+        
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        
+        stdout, stderr = await process.communicate()
+        
+        if process.returncode != 0:
+            raise Exception(f"FFprobe error: {stderr.decode()}")
+        
+        streams = orjson.loads(stdout).get("streams", [])
+        return [
+            stream.get("codec_name", "unknown")
+            for stream in streams
+            if stream.get("codec_type") in ("video", "audio")
+        ]
+        
+    except FileNotFoundError:
+        raise Exception("FFprobe not found. Please install FFmpeg.")
+    except Exception as e:
+        raise Exception(f"Failed to probe codecs: {str(e)}")
+
+
+async def extract_audio_from_stream(
+    chunks: AsyncIterator[bytes],
+    output_path: Path,
     bitrate: str = "192k"
 ) -> Path:
     """
-    Extract audio stream from a video file.
+    Extract audio to MP3 from media fed to FFmpeg through stdin.
+    Only suitable for containers that can be demuxed without seeking.
     
     Args:
-        input_path: Path to the input video file
+        chunks: Async iterator yielding the input file's bytes
         output_path: Path for the output audio file
         bitrate: Audio bitrate (e.g., "192k")
         
@@ -96,22 +154,43 @@ async def extract_audio(
     """
     try:
         cmd = [
-            'ffmpeg',
-            '-i', str(input_path),
+            FFMPEG,
+            '-i', 'pipe:0',
             '-vn',  # No video
             '-acodec', 'libmp3lame',
             '-ab', bitrate,
+            '-f', 'mp3',
             '-y',  # Overwrite output
             str(output_path)
         ]
         
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
+        async with ffmpeg_slot() as pin:
+            process = await asyncio.create_subprocess_exec(
+                *pin, *quiet(with_threads(cmd)),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            
+            # Drain stderr while feeding stdin so FFmpeg never blocks on a full pipe
+            stderr_task = asyncio.ensure_future(process.stderr.read())
+            
+            try:
+                async for chunk in chunks:
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # FFmpeg exited early; its return code tells us why
+            except BaseException:
+                # The download failed; don't leave FFmpeg running on partial input
+                process.kill()
+                await process.wait()
+                raise
+            finally:
+                process.stdin.close()
+            
+            await process.wait()
+            stderr = await stderr_task
         
         if process.returncode != 0:
             raise Exception(f"FFmpeg error: {stderr.decode()}")
@@ -124,34 +203,6 @@ async def extract_audio(
         raise Exception(f"Failed to extract audio: {str(e)}")
 
 
-def format_duration(seconds: float) -> str:
-    """Format duration in seconds to HH:MM:SS format."""
-    if seconds <= 0:
-        return "Unknown"
-    
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    
-    if hours > 0:
-        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
-    else:
-        return f"{minutes:02d}:{secs:02d}"
-
-
-def format_size(bytes_size: int) -> str:
-    """Format file size in human-readable format."""
-    if bytes_size <= 0:
-        return "Unknown"
-    
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if bytes_size < 1024:
-            return f"{bytes_size:.1f} {unit}"
-        bytes_size /= 1024
-    
-    return f"{bytes_size:.1f} TB"
-
-
 def format_bitrate(bps: int) -> str:
     """Format bitrate in human-readable format."""
     if bps <= 0:
@@ -164,14 +215,20 @@ def format_bitrate(bps: int) -> str:
 
 
 def eval_fps(fps_string: str) -> str:
-    """Evaluate FPS from fraction string (e.g., '30/1')."""
+    """Evaluate FPS from fraction string (e.g., '30/1' or '30000/1001')."""
     try:
-        if '/' in fps_string:
-            num, den = map(int, fps_string.split('/'))
-            if den > 0:
-                return f"{num/den:.2f} fps"
-        return f"{float(fps_string):.2f} fps"
-    except:
+        num, sep, den = fps_string.partition('/')
+        if sep:
+            num, den = int(num), int(den)
+            # Whole rates like "30/1" or "60/2" need no float formatting;
+            # ffprobe reports "0/0" when the rate is unknown
+            divisor = math.gcd(num, den)
+            num, den = num // divisor, den // divisor
+            if den == 1:
+                return f"{num} fps"
+            return f"{round(num / den, 3)} fps"
+        return f"{round(float(fps_string), 3)} fps"
+    except (ValueError, ZeroDivisionError, AttributeError):
         return "Unknown"
 
 
@@ -201,18 +258,19 @@ def format_metadata_message(metadata: Dict[str, Any]) -> str:
         stream_type = stream.get("type", "unknown").capitalize()
         codec = stream.get("codec", "Unknown")
         
+        # One entry per line, so the join below is the only concatenation
         if stream.get("type") == "video":
-            lines.append(
-                f"  🎬 **{stream_type} #{i}:** {codec}\n"
-                f"      Resolution: {stream.get('resolution', '?')}\n"
-                f"      FPS: {stream.get('fps', '?')}"
-            )
+            lines.extend((
+                f"  🎬 **{stream_type} #{i}:** {codec}",
+                f"      Resolution: {stream.get('resolution', '?')}",
+                f"      FPS: {stream.get('fps', '?')}",
+            ))
         elif stream.get("type") == "audio":
-            lines.append(
-                f"  🔊 **{stream_type} #{i}:** {codec}\n"
-                f"      Sample Rate: {stream.get('sample_rate', '?')}\n"
-                f"      Channels: {stream.get('channels', '?')}"
-            )
+            lines.extend((
+                f"  🔊 **{stream_type} #{i}:** {codec}",
+                f"      Sample Rate: {stream.get('sample_rate', '?')}",
+                f"      Channels: {stream.get('channels', '?')}",
+            ))
         else:
             lines.append(f"  📎 **{stream_type} #{i}:** {codec}")
     
@@ -0,0 +1,158 @@
+"""
+Shared FFmpeg process runner.
+Caps the number of FFmpeg processes running at once and pins each to its own
+share of the CPUs so concurrent users don't thrash the CPU, and detects
+hardware video encoders.
+"""
+
+import asyncio
+import contextlib
+import os
+import shutil
+from collections import deque
+from typing import AsyncIterator, Deque, List, Optional
+
+from config import FFMPEG_MAX_CONCURRENT, HW_ENCODER, VAAPI_DEVICE
+
+# Binaries resolved once at import, so spawning them skips the PATH search.
+# The bare names are kept as a fallback so a missing install still fails
+# with FileNotFoundError when a job runs.
+FFMPEG = shutil.which("ffmpeg") or "ffmpeg"
+FFPROBE = shutil.which("ffprobe") or "ffprobe"
+TASKSET = shutil.which("taskset")
+
+# Device node each hardware encoder backend needs, in detection order
+HW_DEVICES = {
+    "nvenc": "/dev/nvidiactl",
+    "vaapi": VAAPI_DEVICE,
+}
+
+
+def _usable_cpus() -> List[int]:
+    """CPUs this process may run on (respects container cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+_CPUS = _usable_cpus()
+
+# Each concurrent FFmpeg job gets an equal share of the CPUs
+FFMPEG_THREADS = max(1, len(_CPUS) // FFMPEG_MAX_CONCURRENT)
+
+# Core sets handed out to jobs, one per slot. Pinning is skipped when
+# there are more slots than CPUs or taskset isn't installed.
+_core_slots: Deque[str] = deque()
+if TASKSET and FFMPEG_MAX_CONCURRENT <= len(_CPUS):
+    for i in range(FFMPEG_MAX_CONCURRENT):
+        cores = _CPUS[i * FFMPEG_THREADS:(i + 1) * FFMPEG_THREADS]
+        _core_slots.append(",".join(map(str, cores)))
+
+_semaphore: Optional[asyncio.Semaphore] = None
+_hw_encoder: Optional[str] = None
+_hw_probed = False
+
+
+@contextlib.asynccontextmanager
+async def ffmpeg_slot() -> AsyncIterator[List[str]]:
+    """
+    Wait for one of the limited FFmpeg slots and hold it.
+    
+    Yields:
+        Command prefix pinning the process to the slot's cores
+        (empty if pinning is unavailable)
+    """
+    global _semaphore
+    if _semaphore is None:
+        # Created on first use so it belongs to the bot's running event loop
+        _semaphore = asyncio.Semaphore(FFMPEG_MAX_CONCURRENT)
+    
+    async with _semaphore:
+        cores = _core_slots.popleft() if _core_slots else None
+        try:
+            yield [TASKSET, '-c', cores] if cores else []
+        finally:
+            if cores:
+                _core_slots.append(cores)
+
+
+# Global options for every FFmpeg run: without the banner and info-level
+# progress lines, stderr only carries errors and stays small
+QUIET_ARGS = ['-hide_banner', '-loglevel', 'error']
+
+
+def quiet(cmd: List[str]) -> List[str]:
+    """Add QUIET_ARGS right after the executable of an FFmpeg command."""
+    return [cmd[0], *QUIET_ARGS, *cmd[1:]]
+
+
+def with_threads(cmd: List[str]) -> List[str]:
+    """Add this job's thread limits just before the output path of an FFmpeg command."""
+    threads = str(FFMPEG_THREADS)
+    return cmd[:-1] + ['-threads', threads, '-filter_threads', threads, cmd[-1]]
+
+
+async def run_ffmpeg(cmd: List[str]) -> None:
+    """
+    Run an FFmpeg command as an asyncio subprocess, waiting for a free slot first.
+    
+    Args:
+        cmd: Full command line, starting with the FFmpeg executable
+            and ending with the output path
+        
+    Raises:
+        FileNotFoundError: If FFmpeg is not installed
+        Exception: If FFmpeg exits with a non-zero status
+    """
+    async with ffmpeg_slot() as pin:
+        # Nothing useful goes to stdout, and with QUIET_ARGS stderr is
+        # empty unless the run fails
+        process = await asyncio.create_subprocess_exec(
+            *pin, *quiet(with_threads(cmd)),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        
+        _, stderr = await process.communicate()
+    
+    if process.returncode != 0:
+        raise Exception(f"FFmpeg error: {stderr.decode()}")
+
+
+async def _detect_hw_encoder() -> Optional[str]:
+    """Find a hardware H.264 encoder that FFmpeg supports and whose device exists."""
+    if HW_ENCODER == "none":
+        return None
+    candidates = list(HW_DEVICES) if HW_ENCODER == "auto" else [HW_ENCODER]
+    
+    try:
+        process = await asyncio.create_subprocess_exec(
+            FFMPEG, '-hide_banner', '-encoders',
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate()
+    except FileNotFoundError:
+        return None
+    
+    encoders = stdout.decode(errors="replace")
+    for name in candidates:
+        if f"h264_{name}" in encoders and os.path.exists(HW_DEVICES.get(name, "")):
+            return name
+    return None
+
+
+async def hw_encoder() -> Optional[str]:
+    """
+    Get the hardware H.264 encoder backend to use.
+    Detected on first call and cached for the lifetime of the process.
+    
+    Returns:
+        "nvenc", "vaapi", or None to encode with libx264
+    """
+    global _hw_encoder, _hw_probed
+    if not _hw_probed:
+        _hw_encoder = await _detect_hw_encoder()
+        _hw_probed = True
+    return _hw_encoder
@@ -0,0 +1,199 @@
+"""
+Outgoing rate limiting for Telegram Bot API calls.
+Keeps sends and status edits under Telegram's global (~30/s) and per-chat (~1/s) limits.
+"""
+
+import asyncio
+import functools
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram.error import RetryAfter
+
+# Give up on a call after this many consecutive RetryAfter responses
+MAX_RETRIES = 3
+
+# Successful calls needed before a throttled bucket speeds up again
+RECOVERY_STEP = 10
+
+# Per-chat buckets kept before idle ones are dropped, and how long a
+# bucket must have been unused to count as idle
+MAX_CHAT_BUCKETS = 10_000
+BUCKET_IDLE_SECONDS = 60
+
+
+def _seconds(value) -> float:
+    """Normalize RetryAfter.retry_after (int or timedelta) to seconds."""
+    if hasattr(value, "total_seconds"):
+        return value.total_seconds()
+    return float(value)
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket that backs off when Telegram answers with RetryAfter.
+
+    The rate is halved on every RetryAfter and raised again by a tenth of
+    the configured rate after each run of RECOVERY_STEP successful calls.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = rate / 8
+        self.burst = burst
+        self._next_slot = 0.0
+        self._successes = 0
+
+    async def acquire(self) -> None:
+        """Wait until the next slot for this bucket is available."""
+        now = time.monotonic()
+        # Allow up to `burst` calls back-to-back after an idle period
+        slot = max(self._next_slot, now - (self.burst - 1) / self.rate)
+        self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def on_success(self) -> None:
+        """Record a successful call and recover the rate gradually."""
+        self._successes += 1
+        if self._successes >= RECOVERY_STEP and self.rate < self.max_rate:
+            self._successes = 0
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+    def slow_down(self) -> None:
+        """Halve the rate, e.g. after a RetryAfter."""
+        self._successes = 0
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def on_retry_after(self, retry_after: float) -> None:
+        """Slow down and hold off new calls for the period Telegram asked for."""
+        self.slow_down()
+        self._next_slot = max(self._next_slot, time.monotonic() + retry_after)
+
+    def is_idle(self, now: float) -> bool:
+        """True if no call has been scheduled for BUCKET_IDLE_SECONDS."""
+        return self._next_slot + BUCKET_IDLE_SECONDS < now
+
+
+# Telegram allows about 30 messages per second across all chats
+GLOBAL_BUCKET = AdaptiveTokenBucket(28, burst=28)
+
+# ...and about one message per second in a single chat
+_chat_buckets: Dict[int, AdaptiveTokenBucket] = {}
+
+# Latest requested edit per message, so superseded status edits are dropped
+_edit_generations: Dict[Tuple[int, int], int] = {}
+
+
+def _chat_bucket(chat_id: int) -> AdaptiveTokenBucket:
+    """Get a chat's bucket, dropping idle buckets once there are too many."""
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        if len(_chat_buckets) >= MAX_CHAT_BUCKETS:
+            now = time.monotonic()
+            for key in [k for k, b in _chat_buckets.items() if b.is_idle(now)]:
+                del _chat_buckets[key]
+        bucket = _chat_buckets[chat_id] = AdaptiveTokenBucket(1)
+    return bucket
+
+
+async def _run_limited(
+    chat_id: int,
+    call: Callable[[], Awaitable],
+    still_wanted: Optional[Callable[[], bool]] = None
+):
+    """
+    Run an API call once both buckets allow it, retrying on RetryAfter.
+    
+    Returns None without calling if `still_wanted` returns False once the
+    slot is available.
+    """
+    chat_bucket = _chat_bucket(chat_id)
+    
+    for attempt in range(MAX_RETRIES + 1):
+        await chat_bucket.acquire()
+        await GLOBAL_BUCKET.acquire()
+        
+        if still_wanted is not None and not still_wanted():
+            return None
+        
+        try:
+            result = await call()
+        except RetryAfter as e:
+            if attempt == MAX_RETRIES:
+                raise
+            # Flood waits are usually per chat, so only this chat waits them
+            # out; other chats just see a lower global rate
+            chat_bucket.on_retry_after(_seconds(e.retry_after))
+            GLOBAL_BUCKET.slow_down()
+            continue
+        
+        chat_bucket.on_success()
+        GLOBAL_BUCKET.on_success()
+        return result
+
+
+async def rl_send(chat_id: int, send: Callable[[], Awaitable]):
+    """
+    Rate-limited wrapper for sending a message or file to a chat.
+    
+    `send` is called again after each RetryAfter, so it must start a fresh
+    request every time (pass file paths, not open file objects). TimedOut
+    is not retried: the file may already have reached the chat, and sending
+    it again would duplicate it.
+    
+    Args:
+        chat_id: Chat the message is sent to
+        send: Zero-argument callable returning the send coroutine
+        
+    Returns:
+        Whatever `send` returns
+    """
+    return await _run_limited(chat_id, send)
+
+
+async def rl_edit_message(bot, chat_id: int, message_id: int, text: str, **kwargs):
+    """
+    Rate-limited replacement for `bot.edit_message_text`.
+
+    If a newer edit for the same message is requested while this one is
+    waiting for its slot, this one is skipped and None is returned.
+
+    Args:
+        bot: Telegram Bot instance
+        chat_id: Chat containing the message
+        message_id: Message to edit
+        text: New message text
+        **kwargs: Passed through to `edit_message_text`
+
+    Returns:
+        The edited message, or None if the edit was superseded
+    """
+    key = (chat_id, message_id)
+    generation = _edit_generations.get(key, 0) + 1
+    _edit_generations[key] = generation
+    
+    def is_latest() -> bool:
+        return _edit_generations.get(key) == generation
+    
+    try:
+        return await _run_limited(
+            chat_id,
+            functools.partial(
+                bot.edit_message_text, text,
+                chat_id=chat_id, message_id=message_id, **kwargs
+            ),
+            is_latest,
+        )
+    finally:
+        if is_latest():
+            del _edit_generations[key]
+
+
+async def rl_edit(query, text: str, **kwargs):
+    """Rate-limited replacement for `query.edit_message_text`."""
+    message = query.message
+    return await rl_edit_message(
+        query.get_bot(), message.chat_id, message.message_id, text, **kwargs
+    )
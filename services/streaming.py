@@ -0,0 +1,87 @@
+"""
+Streaming access to files stored by Telegram.
+Lets callers consume an upload chunk by chunk instead of copying it to disk first.
+"""
+
+import asyncio
+import shutil
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import aiofiles
+import httpx
+
+from config import USE_LOCAL_API, STREAM_CHUNK_SIZE
+
+
+def local_file_path(file) -> Optional[Path]:
+    """
+    Return the path of a file already stored on this machine by the local Bot API server.
+
+    Args:
+        file: telegram.File returned by `bot.get_file`
+
+    Returns:
+        Path that can be read directly, or None if the file must be downloaded
+    """
+    if not USE_LOCAL_API or not file.file_path:
+        return None
+    if file.file_path.startswith(("http://", "https://")):
+        return None
+    path = Path(file.file_path)
+    return path if path.is_file() else None
+
+
+async def iter_file_chunks(file, chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    Yield the contents of a Telegram file in chunks.
+
+    Args:
+        file: telegram.File returned by `bot.get_file`
+        chunk_size: Maximum size of each yielded chunk
+
+    Yields:
+        Consecutive chunks of the file's bytes
+    """
+    # In local mode the Bot API server reports a path on this machine
+    if not file.file_path.startswith(("http://", "https://")):
+        async with aiofiles.open(Path(file.file_path), 'rb') as f:
+            while True:
+                chunk = await f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(60.0)) as client:
+        async with client.stream("GET", file.file_path) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size):
+                yield chunk
+
+
+async def stream_to_disk(file, path: Path, chunk_size: int = STREAM_CHUNK_SIZE) -> Path:
+    """
+    Save a Telegram file to disk without holding it in memory.
+
+    Files already on this machine are copied by the kernel (shutil uses
+    sendfile/copy_file_range); remote files are written chunk by chunk
+    as they arrive.
+
+    Args:
+        file: telegram.File returned by `bot.get_file`
+        path: Destination path
+        chunk_size: Size of each chunk read from Telegram
+
+    Returns:
+        The destination path
+    """
+    source = local_file_path(file)
+    if source:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, shutil.copyfile, source, path)
+        return path
+
+    async with aiofiles.open(path, 'wb') as f:
+        async for chunk in iter_file_chunks(file, chunk_size):
+            await f.write(chunk)
+    return path
@@ -0,0 +1,115 @@
+"""
+Background upload queue for sending processed media back to users.
+Long uploads run in worker tasks so callback handlers return immediately.
+"""
+
+import asyncio
+import functools
+import logging
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from telegram import InputFile
+
+from config import UPLOAD_WORKERS, UPLOAD_QUEUE_SIZE, USE_LOCAL_API
+from services.cleanup import schedule_secure_delete
+from services.ratelimit import rl_edit_message, rl_send
+
+logger = logging.getLogger(__name__)
+
+
+class UploadJob(NamedTuple):
+    """A file waiting to be sent to a chat."""
+    chat_id: int
+    message_id: int  # Status message to update when the upload finishes
+    kind: str  # "audio" or "video"
+    path: Path
+    send_kwargs: Dict[str, Any]  # Extra arguments for send_audio/send_video
+    done_text: str
+    done_parse_mode: Optional[str] = None
+    cleanup: Tuple[Path, ...] = ()  # Files to delete once the job is finished
+
+
+async def _send_file(bot, job: UploadJob):
+    """
+    Make one send attempt for the job's file.
+    
+    The local Bot API server reads the file itself, so it only gets the path.
+    For the cloud API the file is opened for this attempt and streamed; a bare
+    Path would make PTB read the whole file into memory on the event loop.
+    """
+    if job.kind == "audio":
+        method, field = bot.send_audio, "audio"
+    else:
+        method, field = bot.send_video, "video"
+    
+    if USE_LOCAL_API:
+        return await method(chat_id=job.chat_id, **{field: job.path}, **job.send_kwargs)
+    
+    with job.path.open("rb") as file:
+        media = InputFile(
+            file,
+            filename=job.send_kwargs.get('filename', job.path.name),
+            read_file_handle=False,
+        )
+        return await method(chat_id=job.chat_id, **{field: media}, **job.send_kwargs)
+
+
+async def _send(bot, job: UploadJob) -> None:
+    """Send the job's file, backing off if Telegram asks us to slow down."""
+    # Each retry calls _send_file again, so it reopens the file
+    await rl_send(job.chat_id, functools.partial(_send_file, bot, job))
+
+
+async def _upload_worker(bot, queue: asyncio.Queue) -> None:
+    """Process upload jobs from the queue until cancelled."""
+    while True:
+        job = await queue.get()
+        try:
+            await _send(bot, job)
+            await rl_edit_message(
+                bot, job.chat_id, job.message_id, job.done_text,
+                parse_mode=job.done_parse_mode
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Upload to chat {job.chat_id} failed: {e}")
+            try:
+                await rl_edit_message(
+                    bot, job.chat_id, job.message_id,
+                    f"❌ Upload failed\n\nError: {str(e)[:200]}\n\n"
+                    "Please try again."
+                )
+            except Exception as edit_error:
+                logger.error(f"Failed to report upload error: {edit_error}")
+        finally:
+            for path in job.cleanup:
+                schedule_secure_delete(path)
+            queue.task_done()
+
+
+def start_upload_workers(application) -> None:
+    """Create the upload queue and start its worker tasks."""
+    queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+    application.bot_data['upload_queue'] = queue
+    application.bot_data['upload_workers'] = [
+        asyncio.create_task(_upload_worker(application.bot, queue))
+        for _ in range(UPLOAD_WORKERS)
+    ]
+
+
+async def stop_upload_workers(application) -> None:
+    """Cancel the upload worker tasks."""
+    workers = application.bot_data.pop('upload_workers', [])
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def enqueue_upload(application, job: UploadJob) -> None:
+    """
+    Queue a file for upload.
+    Waits only if the queue is full; ownership of `job.cleanup` passes to the worker.
+    """
+    await application.bot_data['upload_queue'].put(job)
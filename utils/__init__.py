@@ -1,9 +1,12 @@
 """Utilities package for validation and helper functions."""
 
 from .validators import validate_file_format, validate_file_size, get_file_extension
+from .formatters import format_duration, format_size
 
 __all__ = [
     "validate_file_format",
     "validate_file_size",
     "get_file_extension",
+    "format_duration",
+    "format_size",
 ]
@@ -0,0 +1,58 @@
+"""
+Display formatting helpers shared by the services and handlers.
+"""
+
+from typing import Sequence
+
+# Binary size units; unit i covers sizes from 1024**i bytes
+SIZE_UNITS = ("B", "KB", "MB", "GB", "TB")
+
+
+def format_size(size_bytes: int, units: Sequence[str] = SIZE_UNITS) -> str:
+    """
+    Format a byte count with the largest unit from `units` that fits.
+    
+    The unit is picked from the size's bit length, (bit_length - 1) // 10
+    being its power of 1024, so no division loop is needed.
+    
+    Args:
+        size_bytes: Size in bytes
+        units: Unit names for successive powers of 1024, smallest first;
+            sizes past the last unit are shown in it
+        
+    Returns:
+        Human-readable size string (e.g., "512 B", "15.5 MB")
+    """
+    index = min(max(size_bytes.bit_length() - 1, 0) // 10, len(units) - 1)
+    if index == 0:
+        return f"{size_bytes} {units[0]}"
+    return f"{size_bytes / (1 << (10 * index)):.1f} {units[index]}"
+
+
+def format_duration(seconds) -> str:
+    """
+    Format a duration as MM:SS, or HH:MM:SS when it is an hour or longer.
+    
+    Args:
+        seconds: Duration in seconds (number or numeric string)
+        
+    Returns:
+        Formatted duration, or "Unknown" if missing or invalid
+    """
+    if not seconds:
+        return "Unknown"
+    
+    try:
+        seconds = int(float(seconds))
+    except (ValueError, TypeError):
+        return "Unknown"
+    
+    if seconds < 0:
+        return "Unknown"
+    
+    hours, rem = divmod(seconds, 3600)
+    minutes, secs = divmod(rem, 60)
+    
+    if hours > 0:
+        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
@@ -2,15 +2,25 @@
 Input validation utilities for the Telegram Media Bot.
 """
 
-from pathlib import Path
+import functools
 from config import SUPPORTED_FORMATS, MAX_FILE_SIZE_BYTES
 
+# Set form of SUPPORTED_FORMATS for constant-time lookups
+_SUPPORTED_EXTS = frozenset(SUPPORTED_FORMATS)
 
+
+@functools.lru_cache(maxsize=4096)
 def get_file_extension(filename: str) -> str:
-    """Extract file extension from filename."""
-    return Path(filename).suffix.lower()
+    """Extract file extension from filename (same rules as Path.suffix)."""
+    name = filename.rpartition('/')[2]
+    index = name.rfind('.')
+    # A leading dot (".bashrc") or a trailing one ("file.") is not an extension
+    if 0 < index < len(name) - 1:
+        return name[index:].lower()
+    return ""
 
 
+@functools.lru_cache(maxsize=4096)
 def validate_file_format(filename: str) -> bool:
     """
     Check if file format is supported.
@@ -21,8 +31,7 @@ def validate_file_format(filename: str) -> bool:
     Returns:
         True if format is supported, False otherwise
     """
-    ext = get_file_extension(filename)
-    return ext in SUPPORTED_FORMATS
+    return get_file_extension(filename) in _SUPPORTED_EXTS
 
 
 def validate_file_size(file_size: int) -> bool:
@@ -36,23 +45,3 @@ def validate_file_size(file_size: int) -> bool:
         True if size is within limits, False otherwise
     """
     return file_size <= MAX_FILE_SIZE_BYTES
-
-
-def format_file_size(size_bytes: int) -> str:
-    """
-    Format file size in human-readable format.
-    
-    Args:
-        size_bytes: Size in bytes
-        
-    Returns:
-        Human-readable size string (e.g., "15.5 MB")
-    """
-    if size_bytes < 1024:
-        return f"{size_bytes} B"
-    elif size_bytes < 1024 * 1024:
-        return f"{size_bytes / 1024:.1f} KB"
-    elif size_bytes < 1024 * 1024 * 1024:
-        return f"{size_bytes / (1024 * 1024):.1f} MB"
-    else:
-        return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"